@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"Compare the domain inversions through the parse cache and without it"
+import argparse
+import itertools
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tryton.common.domain_inversion import (  # noqa: E402
+    domain_inversion, parse)
+
+
+def make_domain(fields, value=0):
+    domain = [['f%d' % i, '>=', value + i] for i in range(0, fields, 3)]
+    domain += [['OR', ['f%d' % i, '=', i], ['f%d' % (i + 1), '!=', None]]
+        for i in range(1, fields, 3)]
+    return domain
+
+
+def uncached(domain, symbol, context=None):
+    expression = parse(domain)
+    if symbol not in expression.variables:
+        return True
+    return expression.inverse(symbol, context or {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fields', type=int, default=100)
+    parser.add_argument('--number', type=int, default=10)
+    args = parser.parse_args()
+
+    symbols = ['f%d' % i for i in range(args.fields)]
+    context = {s: i for i, s in enumerate(symbols) if i % 2}
+    domain = make_domain(args.fields)
+    values = itertools.count(1)
+
+    def cold(inversion):
+        # A new domain for each record as when the values of a domain change
+        domain = make_domain(args.fields, next(values))
+        for symbol in symbols:
+            inversion(domain, symbol)
+
+    def warm(inversion, context=None):
+        for symbol in symbols:
+            inversion(domain, symbol, context)
+
+    for symbol in symbols:
+        assert domain_inversion(domain, symbol) == uncached(domain, symbol)
+        assert (domain_inversion(domain, symbol, context)
+            == uncached(domain, symbol, context))
+    print('%d fields, inversions on all the fields' % args.fields)
+    for name, func in [
+            ('new domain', cold),
+            ('same domain', warm),
+            ('with context', partial_context(warm, context)),
+            ]:
+        durations = [min(timeit.repeat(
+                    lambda: func(inversion), number=args.number,
+                    repeat=3)) / args.number
+            for inversion in [domain_inversion, uncached]]
+        print('  %-12s cached %8.2f ms  uncached %8.2f ms' % (
+                name, durations[0] * 1000, durations[1] * 1000))
+
+
+def partial_context(func, context):
+    return lambda inversion: func(inversion, context)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"Compare the evaluation of the states with and without the record snapshot"
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tryton.gui.window.view_form.model.group import Group  # noqa: E402
+from tryton.pyson import PYSONEncoder, Eval  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fields', type=int, default=50)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    names = ['field%s' % i for i in range(args.fields)]
+    group = Group('bench', {
+            n: {'name': n, 'type': 'integer'} for n in names})
+    group.load([1])
+    record, = group
+    record.set({n: i for i, n in enumerate(names)}, validate=False)
+    states = PYSONEncoder().encode(
+        {'readonly': Eval(names[0], 0) > Eval(names[-1], 0)})
+
+    def cold():
+        # Any change of the values invalidates the snapshot
+        record.value[names[0]] = record.value[names[0]]
+        return record.expr_eval(states)
+
+    def warm():
+        return record.expr_eval(states)
+
+    assert cold() == warm()
+    print('%d fields, %d evaluations' % (args.fields, args.number))
+    for name, func in [('changed', cold), ('unchanged', warm)]:
+        duration = min(timeit.repeat(
+                func, number=args.number, repeat=3)) / args.number
+        print('  %-10s %8.2f µs' % (name, duration * 1e6))
+
+
+if __name__ == '__main__':
+    main()
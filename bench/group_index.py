@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"Compare the time of Group.index with list.index after the group changes"
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tryton.gui.window.view_form.model.group import Group  # noqa: E402
+from tryton.gui.window.view_form.model.record import Record  # noqa: E402
+
+
+def changes(group):
+    "Yield the name of each change applied to the group"
+    size = len(group)
+    yield 'load'
+    group.insert(size // 2, Record(group.model_name, -1, group=group))
+    yield 'insert'
+    group.pop(size // 3)
+    yield 'pop'
+    group._remove(group[size // 4])
+    yield 'remove'
+    group.sort(key=lambda r: r.id)
+    yield 'sort'
+    group.reverse()
+    yield 'reverse'
+    del group[size // 5]
+    yield 'delitem'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    group = Group('bench', {})
+    group.load(list(range(1, args.records + 1)))
+    print('%d records, %d lookups after each change' % (
+            args.records, args.lookups))
+    for change in changes(group):
+        records = random.sample(list(group), args.lookups)
+        # The first lookup after a change rebuilds the positions
+        group_time = timeit.timeit(
+            lambda: [group.index(r) for r in records], number=1)
+        list_time = timeit.timeit(
+            lambda: [list.index(group, r) for r in records], number=1)
+        assert all(group.index(r) == list.index(group, r) for r in group), \
+            change
+        print('  %-8s Group.index %8.2f ms  list.index %8.2f ms' % (
+                change, group_time * 1000, list_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
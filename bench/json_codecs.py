@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""Compare the decoding time of the JSON codecs on read payloads
+
+The encoding is out of scope as all the codecs encode with the standard
+library."""
+import argparse
+import datetime
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tryton.jsonrpc import CODECS, PythonCodec  # noqa: E402
+
+
+def payload(rows, typed):
+    result = []
+    for i in range(rows):
+        row = {
+            'id': i,
+            'rec_name': 'Record %s' % i,
+            'code': 'C%06d' % i,
+            'active': bool(i % 2),
+            'quantity': i * 1.5,
+            'party': i % 100,
+            'party.rec_name': 'Party %s' % (i % 100),
+            }
+        if typed:
+            row['date'] = datetime.date(2020, 1, 1) + datetime.timedelta(i)
+            row['amount'] = Decimal(i) / 100
+        result.append(row)
+    return PythonCodec().dumps({'id': 0, 'result': result}).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    for typed in (False, True):
+        data = payload(args.rows, typed)
+        expected = PythonCodec().loads(data)
+        print('%d rows %s typed values (%d bytes)' % (
+                args.rows, 'with' if typed else 'without', len(data)))
+        for name, codec in sorted(CODECS.items()):
+            codec = codec()
+            assert codec.loads(data) == expected, name
+            duration = min(timeit.repeat(
+                    lambda: codec.loads(data), number=args.number,
+                    repeat=3)) / args.number
+            print('  %-8s %8.2f ms' % (name, duration * 1000))
+
+
+if __name__ == '__main__':
+    main()
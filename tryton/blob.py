@@ -0,0 +1,158 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import atexit
+import collections
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from functools import partial
+
+from tryton.config import get_config_dir
+
+BLOBS_PATH = os.path.join(get_config_dir(), 'blobs')
+
+
+class Blob(object):
+    "Reference to a value of the store held until it is released"
+
+    def __init__(self, store, digest, size):
+        self.store = store
+        self.digest = digest
+        self.size = size
+        self.released = False
+        self._map = None
+
+    @property
+    def path(self):
+        return self.store.path(self.digest)
+
+    def read(self):
+        "Return a read-only memory map of the value"
+        if not self.size:
+            return b''
+        if self._map is None:
+            with open(self.path, 'rb') as fp:
+                self._map = mmap.mmap(
+                    fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            # The map may still be used by the callers of read
+            self._map = None
+            self.store.release(self.digest)
+
+    destroy = release
+
+    def __del__(self):
+        # The collector may run while the store lock is held
+        if not self.released:
+            self.released = True
+            self.store.release_later(self.digest)
+
+
+class BlobStore(object):
+    """Files of the binary values by their SHA-256
+
+    Identical values are stored once and a file is removed when the last
+    Blob referencing it is released. The files of the session are removed
+    by clear."""
+    chunk_size = 1024 * 1024
+
+    def __init__(self):
+        self.directory = None
+        self.counts = {}
+        self.lock = threading.Lock()
+        # Digests released by finalizers which can not take the lock
+        self.pending = collections.deque()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def add(self, data):
+        "Store the data (bytes, a file or an iterable of bytes) as a Blob"
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.lock:
+            if self.directory is None:
+                os.makedirs(BLOBS_PATH, 0o700, exist_ok=True)
+                self.directory = tempfile.mkdtemp(dir=BLOBS_PATH)
+        if isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+            digest = hashlib.sha256(data).hexdigest()
+            if not self._acquire(digest):
+                fd, filename = tempfile.mkstemp(dir=self.directory)
+                with os.fdopen(fd, 'wb') as fp:
+                    fp.write(data)
+                self._commit(digest, filename)
+            return Blob(self, digest, len(data))
+
+        if hasattr(data, 'read'):
+            data = iter(partial(data.read, self.chunk_size), b'')
+        digest, size = hashlib.sha256(), 0
+        fd, filename = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fp:
+            for chunk in data:
+                digest.update(chunk)
+                fp.write(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+        if self._acquire(digest):
+            os.remove(filename)
+        else:
+            self._commit(digest, filename)
+        return Blob(self, digest, size)
+
+    def _acquire(self, digest):
+        with self.lock:
+            self._release_pending()
+            if digest in self.counts:
+                self.counts[digest] += 1
+                return True
+            return False
+
+    def _commit(self, digest, filename):
+        with self.lock:
+            self._release_pending()
+            os.replace(filename, self.path(digest))
+            self.counts[digest] = self.counts.get(digest, 0) + 1
+
+    def release(self, digest):
+        with self.lock:
+            self._release_pending()
+            self._release(digest)
+
+    def release_later(self, digest):
+        "Release the digest at the next operation on the store"
+        self.pending.append(digest)
+
+    def _release_pending(self):
+        while self.pending:
+            self._release(self.pending.popleft())
+
+    def _release(self, digest):
+        if digest not in self.counts:
+            return
+        self.counts[digest] -= 1
+        if self.counts[digest]:
+            return
+        del self.counts[digest]
+        try:
+            os.remove(self.path(digest))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+            if self.directory is not None:
+                shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+            self.counts.clear()
+
+
+BLOBS = BlobStore()
+atexit.register(BLOBS.clear)
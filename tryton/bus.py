@@ -91,9 +91,12 @@ def _listen(connection):
 
 def handle(message):
     from tryton.gui.main import Main
+    from tryton.common.completion import COMPLETIONS
 
     app = Main()
     if message['type'] == 'notification':
         app.show_notification(
             message.get('title', ''), message.get('body', ''),
             message.get('priority', 1))
+    elif message['type'] == 'written':
+        COMPLETIONS.expire(message.get('model'))
@@ -3,6 +3,7 @@
 from .common import *
 from .domain_inversion import domain_inversion, eval_domain, localize_domain, \
         merge, inverse_leaf, filter_leaf, prepare_reference_domain, \
-        extract_reference_models, concat, simplify, unique_value
+        extract_reference_models, concat, simplify, unique_value, \
+        eval_domain_column
 from .environment import EvalEnvironment
 from . import timedelta
@@ -0,0 +1,187 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import atexit
+import json
+import logging
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+from gi.repository import GdkPixbuf, GLib
+
+from tryton.config import get_config_dir
+
+logger = logging.getLogger(__name__)
+ATLAS_PATH = os.path.join(get_config_dir(), 'icons')
+
+
+class IconAtlas(object):
+    """Pixels of the rasterized icons stored in one file
+
+    The entries are appended to the file and located by an index merged
+    with the one on disk at exit, as other processes may append to the same
+    file. The file is memory mapped and the last icons added are kept in
+    memory."""
+    max_size = 32 * 1024 * 1024
+    max_added = 256
+
+    def __init__(self, path=ATLAS_PATH):
+        self.path = path
+        self.index = {}
+        self.added = OrderedDict()
+        self.data = None
+        self._size = 0
+        self._dirty = False
+        self._identity = None
+        self._lock = Lock()
+        self._loaded = False
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, 'rb') as fp:
+                self._check(fp)
+                size = os.fstat(fp.fileno()).st_size
+                if size > self.max_size:
+                    raise ValueError('Icon atlas too big')
+                if size:
+                    self.data = mmap.mmap(
+                        fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.warning('Unable to load icon atlas', exc_info=True)
+            # Start a new atlas
+            for path in [self.path, self.path + '.json']:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return
+        self._size = size
+        try:
+            with open(self.path + '.json') as fp:
+                index = json.load(fp)
+        except FileNotFoundError:
+            # The other processes using the file have not saved their index
+            index = {}
+        except ValueError:
+            logger.warning('Unable to load icon atlas index', exc_info=True)
+            index = {}
+        for key, entry in index.items():
+            offset, length = entry[:2]
+            if offset + length <= size:
+                self.index[key] = tuple(entry)
+
+    def get(self, key):
+        "Return the pixbuf stored for key or None"
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if key in self.added:
+                self.added.move_to_end(key)
+                return self.added[key]
+            try:
+                offset, length, width, height, rowstride, has_alpha = (
+                    self.index[key])
+            except KeyError:
+                return None
+            try:
+                if not self._map(offset + length):
+                    return None
+            except (OSError, ValueError):
+                logger.warning('Unable to read icon atlas', exc_info=True)
+                return None
+            pixels = self.data[offset:offset + length]
+        return GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(pixels),
+            GdkPixbuf.Colorspace.RGB, has_alpha, 8, width, height, rowstride)
+
+    def _check(self, fp):
+        "Return if fp is the file of the entries or forget them"
+        stat = os.fstat(fp.fileno())
+        identity = (stat.st_dev, stat.st_ino)
+        if self._identity not in {None, identity}:
+            # Another process started a new atlas
+            self.index.clear()
+            self.data = None
+            self._identity = identity
+            return False
+        self._identity = identity
+        return True
+
+    def _map(self, end):
+        "Map the file again if it does not contain end and return if it does"
+        if self.data is None or len(self.data) < end:
+            with open(self.path, 'rb') as fp:
+                if (not self._check(fp)
+                        or os.fstat(fp.fileno()).st_size < end):
+                    return False
+                self.data = mmap.mmap(
+                    fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def set(self, key, pixbuf):
+        pixels = pixbuf.get_pixels()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self.added[key] = pixbuf
+            self.added.move_to_end(key)
+            while len(self.added) > self.max_added:
+                self.added.popitem(last=False)
+            if self._size + len(pixels) > self.max_size:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), 0o700, exist_ok=True)
+                with open(self.path, 'ab') as fp:
+                    self._check(fp)
+                    fp.write(pixels)
+                    fp.flush()
+                    # The pixels are appended after those of other processes
+                    end = fp.tell()
+            except OSError:
+                logger.warning('Unable to write icon atlas', exc_info=True)
+                return
+            self._size = end
+            self.index[key] = (end - len(pixels), len(pixels),
+                pixbuf.get_width(), pixbuf.get_height(),
+                pixbuf.get_rowstride(), pixbuf.get_has_alpha())
+            self._dirty = True
+
+    def save(self):
+        "Write the index of the entries"
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.path)
+            try:
+                with open(self.path, 'rb') as fp:
+                    self._check(fp)
+                    size = os.fstat(fp.fileno()).st_size
+            except OSError:
+                return
+            # Keep the entries saved by the other processes
+            try:
+                with open(self.path + '.json') as fp:
+                    index = dict(json.load(fp))
+            except (OSError, ValueError, TypeError):
+                index = {}
+            index.update(self.index)
+            index = {k: e for k, e in index.items()
+                if isinstance(e, (list, tuple)) and e[0] + e[1] <= size}
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory)
+                with os.fdopen(fd, 'w') as fp:
+                    json.dump(index, fp)
+                os.replace(tmp_path, self.path + '.json')
+            except OSError:
+                logger.warning(
+                    'Unable to write icon atlas index', exc_info=True)
+            else:
+                self._dirty = False
+
+
+ICON_ATLAS = IconAtlas()
+atexit.register(ICON_ATLAS.save)
@@ -2,6 +2,7 @@
 # this repository contains the full copyright notices and license terms.
 
 import gettext
+import hashlib
 import os
 import subprocess
 import tempfile
@@ -11,6 +12,7 @@ import unicodedata
 import colorsys
 import xml.etree.ElementTree as ET
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 try:
     from http import HTTPStatus
@@ -34,13 +36,14 @@ try:
     import ssl
 except ImportError:
     ssl = None
-from threading import Lock
+from threading import Lock, Thread
 
 from gi.repository import Gdk, GdkPixbuf, GLib, GObject, Gtk
 
 from tryton import __version__
 from tryton.exceptions import TrytonServerError, TrytonError
 from tryton.pyson import PYSONEncoder
+from .atlas import ICON_ATLAS
 from .underline import set_underline
 from .widget_style import widget_class
 
@@ -50,12 +53,20 @@ logger = logging.getLogger(__name__)
 
 class IconFactory:
 
-    batchnum = 10
-    _tryton_icons = []
     _name2id = {}
     _icons = {}
     _local_icons = {}
     _pixbufs = defaultdict(dict)
+    _rendered = set()
+    _renderer = None
+    _sizes = {
+        Gtk.IconSize.MENU: 16,
+        Gtk.IconSize.SMALL_TOOLBAR: 16,
+        Gtk.IconSize.LARGE_TOOLBAR: 24,
+        Gtk.IconSize.BUTTON: 16,
+        Gtk.IconSize.DND: 12,
+        Gtk.IconSize.DIALOG: 48,
+        }
 
     @classmethod
     def load_local_icons(cls):
@@ -69,18 +80,54 @@ class IconFactory:
         if not refresh:
             cls._name2id.clear()
             cls._icons.clear()
-        del cls._tryton_icons[:]
+            icons = rpc.load_cache('icons')
+            name2id = rpc.load_cache('icon_names')
+            if icons is not None and name2id is not None:
+                # The stored icons are revalidated in the background and
+                # updated by the main loop
+                cls._name2id.update(name2id)
+                cls._icons.update(icons)
+                Thread(target=cls._fetch_icons, args=(False, GLib.idle_add),
+                    daemon=True).start()
+                return
+        cls._fetch_icons(refresh)
 
+    @classmethod
+    def _fetch_icons(cls, refresh=False, publish=None):
         try:
             icons = rpc.execute('model', 'ir.ui.icon', 'list_icons',
                 rpc.CONTEXT)
         except TrytonServerError:
-            icons = []
-        for icon_id, icon_name in icons:
-            if refresh and icon_name in cls._icons:
-                continue
-            cls._tryton_icons.append((icon_id, icon_name))
-            cls._name2id[icon_name] = icon_id
+            return
+        name2id = {name: id_ for id_, name in icons}
+        if refresh:
+            ids = [i for n, i in name2id.items() if n not in cls._icons]
+        else:
+            ids = list(name2id.values())
+        try:
+            icons = rpc.execute('model', 'ir.ui.icon', 'read', ids,
+                ['name', 'icon'], rpc.CONTEXT)
+        except TrytonServerError:
+            return
+        icons = {i['name']: i['icon'].encode('utf-8') for i in icons}
+        if publish:
+            publish(cls._set_icons, name2id, icons, refresh)
+        else:
+            cls._set_icons(name2id, icons, refresh)
+
+    @classmethod
+    def _set_icons(cls, name2id, icons, refresh):
+        cls._name2id.update(name2id)
+        for name, data in icons.items():
+            if cls._icons.get(name) != data:
+                for pixbufs in cls._pixbufs.values():
+                    pixbufs.pop(name, None)
+            cls._icons[name] = data
+        if not refresh:
+            for name in set(cls._icons) - set(name2id):
+                del cls._icons[name]
+        rpc.save_cache('icons', cls._icons)
+        rpc.save_cache('icon_names', cls._name2id)
 
     @classmethod
     def register_icon(cls, iconname):
@@ -91,42 +138,72 @@ class IconFactory:
             return
         if iconname not in cls._name2id:
             cls.load_icons(refresh=True)
-        try:
-            icon_ref = (cls._name2id[iconname], iconname)
-        except KeyError:
-            return
-        idx = cls._tryton_icons.index(icon_ref)
-        to_load = slice(max(0, idx - cls.batchnum // 2),
-            idx + cls.batchnum // 2)
-        ids = [e[0] for e in cls._tryton_icons[to_load]]
-        try:
-            icons = rpc.execute('model', 'ir.ui.icon', 'read', ids,
-                ['name', 'icon'], rpc.CONTEXT)
-        except TrytonServerError:
-            icons = []
-        for icon in icons:
-            name = icon['name']
-            data = icon['icon'].encode('utf-8')
-            cls._icons[name] = data
-            cls._tryton_icons.remove((icon['id'], icon['name']))
-            del cls._name2id[icon['name']]
+        elif iconname not in cls._icons:
+            cls._fetch_icons(refresh=True)
 
     @classmethod
     def get_pixbuf(cls, iconname, size=16, color=None, badge=None):
         colors = CONFIG['icon.colors'].split(',')
         cls.register_icon(iconname)
-        if iconname not in cls._pixbufs[(size, badge)]:
-            if iconname in cls._icons:
-                data = cls._icons[iconname]
-            elif iconname in cls._local_icons:
-                path = cls._local_icons[iconname]
-                with open(path, 'rb') as fp:
-                    data = fp.read()
-            else:
+        if not color:
+            color = colors[0]
+        if badge and not isinstance(badge, str):
+            try:
+                badge = colors[badge]
+            except IndexError:
+                badge = color
+        pixbufs = cls._pixbufs[(size, color, badge)]
+        if iconname not in pixbufs:
+            data = cls._get_data(iconname)
+            if data is None:
                 logger.error("Unknown icon %s" % iconname)
                 return
-            if not color:
-                color = colors[0]
+            pixbufs[iconname] = cls._rasterize(data, size, color, badge)
+            if iconname not in cls._rendered:
+                cls._rendered.add(iconname)
+                if cls._renderer is None:
+                    cls._renderer = ThreadPoolExecutor(1)
+                cls._renderer.submit(cls._prerender, iconname, data, color)
+        return pixbufs[iconname]
+
+    @classmethod
+    def shutdown(cls):
+        "Stop the rendering of the icons in the background"
+        if cls._renderer is not None:
+            cls._renderer.shutdown(wait=False)
+            cls._renderer = None
+
+    @classmethod
+    def _get_data(cls, iconname):
+        if iconname in cls._icons:
+            return cls._icons[iconname]
+        elif iconname in cls._local_icons:
+            path = cls._local_icons[iconname]
+            with open(path, 'rb') as fp:
+                return fp.read()
+
+    @classmethod
+    def _prerender(cls, iconname, data, color):
+        "Rasterize the icon for all the sizes without badge"
+        if cls._renderer is None:
+            # The pending renderings are skipped after the shutdown
+            return
+        pixbufs = {size: cls._rasterize(data, size, color, None)
+            for size in cls._sizes}
+        GLib.idle_add(cls._set_pixbufs, iconname, color, pixbufs)
+
+    @classmethod
+    def _set_pixbufs(cls, iconname, color, pixbufs):
+        for size, pixbuf in pixbufs.items():
+            cls._pixbufs[(size, color, None)].setdefault(iconname, pixbuf)
+
+    @classmethod
+    def _rasterize(cls, data, size, color, badge):
+        width = height = cls._sizes.get(size, size)
+        key = '%s-%s-%s-%s' % (
+            hashlib.sha1(data).hexdigest(), color, badge, width)
+        pixbuf = ICON_ATLAS.get(key)
+        if pixbuf is None:
             try:
                 ET.register_namespace('', 'http://www.w3.org/2000/svg')
                 root = ET.fromstring(data)
@@ -135,11 +212,6 @@ class IconFactory:
                 if not root.attrib.get('fill'):
                     root.attrib['fill'] = color
                 if badge:
-                    if not isinstance(badge, str):
-                        try:
-                            badge = colors[badge]
-                        except IndexError:
-                            badge = color
                     ET.SubElement(root, 'circle', {
                             'cx': '20',
                             'cy': '4',
@@ -149,17 +221,10 @@ class IconFactory:
                 data = ET.tostring(root)
             except ET.ParseError:
                 pass
-            width = height = {
-                Gtk.IconSize.MENU: 16,
-                Gtk.IconSize.SMALL_TOOLBAR: 16,
-                Gtk.IconSize.LARGE_TOOLBAR: 24,
-                Gtk.IconSize.BUTTON: 16,
-                Gtk.IconSize.DND: 12,
-                Gtk.IconSize.DIALOG: 48,
-                }.get(size, size)
             pixbuf = data2pixbuf(data, width, height)
-            cls._pixbufs[(size, badge)][iconname] = pixbuf
-        return cls._pixbufs[(size, badge)][iconname]
+            if pixbuf:
+                ICON_ATLAS.set(key, pixbuf)
+        return pixbuf
 
     @classmethod
     def get_image(cls, iconname, size=16, color=None, badge=None):
@@ -174,32 +239,45 @@ IconFactory.load_local_icons()
 
 class ModelAccess(object):
 
-    batchnum = 100
     _access = {}
-    _models = []
 
     def load_models(self, refresh=False):
         if not refresh:
             self._access.clear()
-        del self._models[:]
+            access = rpc.load_cache('access')
+            if access is not None:
+                # The stored access is revalidated in the background and
+                # updated by the main loop
+                self._access.update(access)
+                Thread(target=self._fetch, args=(GLib.idle_add,),
+                    daemon=True).start()
+                return
+        self._fetch()
 
+    def _fetch(self, publish=None):
+        "Fetch the access of all the models at once"
         try:
-            self._models = rpc.execute('model', 'ir.model', 'list_models',
+            models = rpc.execute('model', 'ir.model', 'list_models',
                 rpc.CONTEXT)
+            access = rpc.execute('model', 'ir.model.access', 'get_access',
+                models, rpc.CONTEXT)
         except TrytonServerError:
-            pass
+            return
+        if publish:
+            publish(self._set_access, access)
+        else:
+            self._set_access(access)
+
+    def _set_access(self, access):
+        self._access.update(access)
+        rpc.save_cache('access', self._access)
 
     def __getitem__(self, model):
         if model in self._access:
             return self._access[model]
-        if model not in self._models:
-            self.load_models(refresh=True)
-        idx = self._models.index(model)
-        to_load = slice(max(0, idx - self.batchnum // 2),
-            idx + self.batchnum // 2)
         try:
             access = rpc.execute('model', 'ir.model.access', 'get_access',
-                self._models[to_load], rpc.CONTEXT)
+                [model], rpc.CONTEXT)
         except TrytonServerError:
             access = {}
         self._access.update(access)
@@ -1045,7 +1123,7 @@ class RPCProgress(object):
 
         if self.exception and self.process_exception_p:
             def rpc_execute(*args):
-                return RPCProgress('execute', args).run(
+                return RPCProgress(self.method, args).run(
                     self.process_exception_p, self.callback)
             try:
                 return process_exception(
@@ -1075,6 +1153,39 @@ def RPCExecute(*args, **kwargs):
     return RPCProgress('execute', args).run(process_exception, callback)
 
 
+def RPCExecuteBatch(calls, **kwargs):
+    """Execute the calls (tuples of RPCExecute arguments) in one round trip
+
+    The result list contains a TrytonServerError for each failing call or,
+    if the exceptions are processed, None when it is not recovered."""
+    rpc_context = rpc.CONTEXT.copy()
+    if kwargs.get('context'):
+        rpc_context.update(kwargs['context'])
+    calls = tuple(tuple(args) + (rpc_context,) for args in calls)
+    process_exception_p = kwargs.get('process_exception', True)
+    callback = kwargs.get('callback')
+
+    def process(results):
+        results = list(results)
+        for i, result in enumerate(results):
+            if isinstance(result, TrytonServerError):
+                try:
+                    results[i] = process_exception(result, *calls[i])
+                except RPCException:
+                    results[i] = None
+        return results
+
+    if process_exception_p and callback:
+        def processed(results):
+            callback(lambda: process(results()))
+        return RPCProgress('execute_batch', calls).run(True, processed)
+    results = RPCProgress('execute_batch', calls).run(
+        process_exception_p, callback)
+    if process_exception_p and not callback:
+        results = process(results)
+    return results
+
+
 def RPCContextReload(callback=None):
     def update(context):
         rpc.context_reset()
@@ -1235,7 +1346,12 @@ def _data2pixbuf(data, width=None, height=None):
     loader = GdkPixbuf.PixbufLoader()
     if width and height:
         loader.set_size(width, height)
-    loader.write(data)
+    if isinstance(data, bytes):
+        loader.write(data)
+    else:
+        # Memory maps are written by pieces
+        for i in range(0, len(data), 1024 * 1024):
+            loader.write(data[i:i + 1024 * 1024])
     loader.close()
     return loader.get_pixbuf()
 
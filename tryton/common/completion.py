@@ -2,9 +2,13 @@
 # this repository contains the full copyright notices and license terms.
 import logging
 import gettext
+import threading
+import time
+from collections import OrderedDict
 
 from gi.repository import GLib, Gtk
 
+from tryton import rpc
 from tryton.config import CONFIG
 from tryton.common import RPCExecute
 from tryton.exceptions import TrytonServerError, TrytonError
@@ -13,6 +17,156 @@ _ = gettext.gettext
 logger = logging.getLogger(__name__)
 
 
+class CompletionCache(object):
+    """Results of the completion searches by model, domain, context and text
+
+    A text is answered from the results of one of its prefixes when they
+    were not truncated by the limit and they all still match the text by
+    name, as the server may also search other fields. Identical searches running at the same
+    time share the same request. name is the key or the index of the name of
+    the results. A text with wildcards is always searched on the server as
+    it may not be filtered locally."""
+
+    def __init__(self, name='rec_name'):
+        self.name = name
+        self.entries = OrderedDict()
+        self.running = {}
+        self.connection = None
+        self.hits = self.refines = self.misses = self.coalesced = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model, domain, context, order):
+        return (model, repr(domain), repr(sorted(context.items())),
+            repr(order))
+
+    def get(self, key, text):
+        "Return the results for text or None"
+        now = time.monotonic()
+        with self._lock:
+            if self.connection is not rpc.CONNECTION:
+                self.entries.clear()
+                self.connection = rpc.CONNECTION
+            for i in range(len(text), 0, -1):
+                try:
+                    expire, results, complete = self.entries[key, text[:i]]
+                except KeyError:
+                    continue
+                if expire < now:
+                    del self.entries[key, text[:i]]
+                    continue
+                if i == len(text):
+                    self.entries.move_to_end((key, text))
+                    self.hits += 1
+                    return results
+                elif complete and not self._wildcard(text):
+                    # The results filtered out may match by other fields
+                    filtered = self._filter(results, text)
+                    if len(filtered) == len(results):
+                        self.refines += 1
+                        return filtered
+                    break
+            self.misses += 1
+
+    def refine(self, key, text):
+        "Return the results of the longest prefix of text matching it"
+        if self._wildcard(text):
+            return []
+        now = time.monotonic()
+        with self._lock:
+            for i in range(len(text) - 1, 0, -1):
+                entry = self.entries.get((key, text[:i]))
+                if entry and entry[0] >= now:
+                    return self._filter(entry[1], text)
+        return []
+
+    @staticmethod
+    def _wildcard(text):
+        return '%' in text or '_' in text
+
+    def _filter(self, results, text):
+        text = text.lower()
+        return [r for r in results if text in r[self.name].lower()]
+
+    def set(self, key, text, results, complete):
+        with self._lock:
+            self.entries[key, text] = (
+                time.monotonic() + CONFIG['completion.ttl'], results,
+                complete)
+            self.entries.move_to_end((key, text))
+            while len(self.entries) > CONFIG['completion.max_entries']:
+                self.entries.popitem(last=False)
+
+    def search(self, model, domain, context, order, text, callback):
+        "Search for text and call callback with the results"
+        key = self.key(model, domain, context, order)
+        if (key, text) in self.running:
+            self.running[key, text].append(callback)
+            self.coalesced += 1
+            return
+        if self._wildcard(text):
+            prefixes = range(0)
+        else:
+            prefixes = range(len(text) - 1, 0, -1)
+        for i in prefixes:
+            if (key, text[:i]) in self.running:
+                # The text may be answered by the running search of a prefix
+                def retry(results):
+                    results = self.get(key, text)
+                    if results is None:
+                        self.search(
+                            model, domain, context, order, text, callback)
+                    else:
+                        callback(results)
+                self.running[key, text[:i]].append(retry)
+                self.coalesced += 1
+                return
+        self.running[key, text] = callbacks = [callback]
+        limit = CONFIG['client.limit']
+
+        def done(results):
+            del self.running[key, text]
+            try:
+                results = results()
+            except (TrytonError, TrytonServerError):
+                results = []
+            else:
+                self.set(key, text, results, len(results) < limit)
+            for callback in callbacks:
+                callback(results)
+        try:
+            RPCExecute('model', model, 'search_read',
+                [('rec_name', 'ilike', '%' + text + '%'), domain], 0, limit,
+                order, ['rec_name'], context=context,
+                process_exception=False, callback=done)
+        except Exception:
+            del self.running[key, text]
+            logging.warn(
+                _("Unable to search for completion of %s") % model,
+                exc_info=True)
+
+    def expire(self, model=None):
+        "Remove the results of the model or all"
+        with self._lock:
+            for key in list(self.entries):
+                if model is None or key[0][0] == model:
+                    del self.entries[key]
+
+    def statistics(self):
+        lookups = self.hits + self.refines + self.misses
+        return {
+            'hits': self.hits,
+            'refines': self.refines,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.refines) / lookups if lookups else 0,
+            'size': len(self.entries),
+            }
+
+
+COMPLETIONS = CompletionCache()
+
+
 def get_completion(search=True, create=True):
     "Return a EntryCompletion"
     completion = Gtk.EntryCompletion()
@@ -44,14 +198,9 @@ def update_completion(entry, record, field, model, domain=None):
         if domain is None:
             domain = field.domain_get(record)
         context = field.get_search_context(record)
-        domain = [('rec_name', 'ilike', '%' + search_text + '%'), domain]
         order = field.get_search_order(record)
 
-        def callback(results):
-            try:
-                results = results()
-            except (TrytonError, TrytonServerError):
-                results = []
+        def display(results):
             if search_text != entry.get_text():
                 return False
             completion_model.clear()
@@ -60,14 +209,19 @@ def update_completion(entry, record, field, model, domain=None):
             completion_model.search_text = search_text
             # Force display of popup
             entry.emit('changed')
-        try:
-            RPCExecute('model', model, 'search_read', domain, 0,
-                CONFIG['client.limit'], order, ['rec_name'], context=context,
-                process_exception=False, callback=callback)
-        except Exception:
-            logging.warn(
-                _("Unable to search for completion of %s") % model,
-                exc_info=True)
+
+        key = COMPLETIONS.key(model, domain, context, order)
+        results = COMPLETIONS.get(key, search_text)
+        if results is not None:
+            display(results)
+        else:
+            # Show the matching results of a shorter text while searching
+            results = COMPLETIONS.refine(key, search_text)
+            if results:
+                display(results)
+                completion_model.search_text = None
+            COMPLETIONS.search(
+                model, domain, context, order, search_text, display)
         return False
     search_text = entry.get_text()
     GLib.timeout_add(300, update, search_text, domain)
@@ -4,8 +4,15 @@
 import re
 import operator
 import datetime
-from collections import defaultdict
+from decimal import Decimal
+from collections import defaultdict, OrderedDict
 from functools import reduce, partial
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def sql_like(value, pattern, ignore_case=True):
@@ -209,6 +216,80 @@ def eval_domain(domain, context, boolop=operator.and_):
             eval_domain(domain[1:], context, boolop))
 
 
+_COMPARISONS = {'=', '!=', '<', '>', '<=', '>='}
+_SCALARS = {int, float, str, bool, Decimal, type(None)}
+_NUMBERS = {int, float}
+
+
+def _compare(operand, column, value):
+    compare = OPERATORS[operand]
+    try:
+        return list(map(compare, column, repeat(value)))
+    except TypeError:
+        pass
+    mask = []
+    for context_field in column:
+        try:
+            mask.append(compare(context_field, value))
+        except TypeError:
+            mask.append(False)
+    return mask
+
+
+def eval_leaf_column(part, column):
+    "compute the leaf boolean values for the column of field values"
+    field, operand, value = part[:3]
+    if '.' in field:
+        return [bool(v) for v in column]
+    if operand in _COMPARISONS and type(value) in _SCALARS - {type(None)}:
+        types = set(map(type, column))
+        if (numpy is not None and types <= _NUMBERS
+                and type(value) in _NUMBERS and len(column) >= 64):
+            array = numpy.array(column)
+            if array.dtype.kind in 'if':
+                return OPERATORS[operand](array, value)
+        if types <= _SCALARS:
+            return _compare(operand, column, value)
+    return [eval_leaf(part, {field: v}) for v in column]
+
+
+def eval_domain_column(domain, columns, size, boolop=operator.and_):
+    """compute the domain boolean value of each row of the columns
+
+    columns is a mapping of the field names to the sequence of their values
+    for the size rows, a missing column is read as None values."""
+    mask = _eval_domain_mask(domain, columns, size, boolop)
+    if numpy is not None and isinstance(mask, numpy.ndarray):
+        return mask.tolist()
+    return list(map(bool, mask))
+
+
+def _eval_domain_mask(domain, columns, size, boolop=operator.and_):
+    if is_leaf(domain):
+        field = domain[0]
+        if '.' in field:
+            field = field.split('.')[0]
+        try:
+            column = columns[field]
+        except KeyError:
+            column = [None] * size
+        return eval_leaf_column(domain, column)
+    elif domain and domain[0] == 'AND':
+        return _eval_domain_mask(domain[1:], columns, size)
+    elif domain and domain[0] == 'OR':
+        return _eval_domain_mask(domain[1:], columns, size, operator.or_)
+    mask = [boolop is operator.and_] * size
+    for part in domain:
+        other = _eval_domain_mask(part, columns, size)
+        if numpy is not None and (isinstance(mask, numpy.ndarray)
+                or isinstance(other, numpy.ndarray)):
+            mask = boolop(numpy.asarray(mask, dtype=bool),
+                numpy.asarray(other, dtype=bool))
+        else:
+            mask = list(map(boolop, mask, other))
+    return mask
+
+
 def localize_domain(domain, field_name=None, strip_target=False):
     "returns only locale part of domain. eg: langage.code -> code"
     if domain in ('AND', 'OR', True, False):
@@ -306,14 +387,50 @@ def parse(domain):
         return And(domain[1:] if domain[0] == 'AND' else domain)
 
 
+def _copy(domain):
+    "Return a copy of the lists and tuples of the domain"
+    if isinstance(domain, list):
+        return [_copy(d) for d in domain]
+    elif isinstance(domain, tuple):
+        return tuple(_copy(d) for d in domain)
+    return domain
+
+
+class _ParseCache(object):
+    "Parsed domains by their representation with the context-free inversions"
+    size = 1024
+
+    def __init__(self):
+        self.expressions = OrderedDict()
+
+    def get(self, domain):
+        key = repr(domain)
+        try:
+            cache = self.expressions[key]
+            self.expressions.move_to_end(key)
+        except KeyError:
+            # Parse a copy as the tree must not change with the domain
+            expression = parse(_copy(domain))
+            cache = self.expressions[key] = (expression, {})
+            if len(self.expressions) > self.size:
+                self.expressions.popitem(last=False)
+        return cache
+
+
+_PARSE_CACHE = _ParseCache()
+
+
 def domain_inversion(domain, symbol, context=None):
     """compute an inversion of the domain eventually the context is used to
     simplify the expression"""
-    if context is None:
-        context = {}
-    expression = parse(domain)
+    expression, inversions = _PARSE_CACHE.get(domain)
     if symbol not in expression.variables:
         return True
+    if not context:
+        if symbol not in inversions:
+            inversions[symbol] = expression.inverse(symbol, {})
+        # The callers may change the inversion
+        return _copy(inversions[symbol])
     return expression.inverse(symbol, context)
 
 
@@ -322,11 +439,18 @@ class And(object):
     def __init__(self, expressions):
         self.branches = list(map(parse, expressions))
         self.variables = set()
+        # The branches with the base of their field or None for expressions
+        self.parts = []
         for expression in self.branches:
             if is_leaf(expression):
-                self.variables.add(self.base(expression[0]))
-            elif isinstance(expression, And):
-                self.variables |= expression.variables
+                base = self.base(expression[0])
+                self.variables.add(base)
+                self.parts.append((expression, base))
+            else:
+                if isinstance(expression, And):
+                    self.variables |= expression.variables
+                self.parts.append((expression, None))
+        self.variables = frozenset(self.variables)
 
     def base(self, expression):
         if '.' not in expression:
@@ -336,8 +460,8 @@ class And(object):
 
     def inverse(self, symbol, context):
         result = []
-        for part in self.branches:
-            if isinstance(part, And):
+        for part, base in self.parts:
+            if base is None:
                 part_inversion = part.inverse(symbol, context)
                 evaluated = isinstance(part_inversion, bool)
                 if not evaluated:
@@ -346,7 +470,7 @@ class And(object):
                     continue
                 else:
                     return False
-            elif is_leaf(part) and self.base(part[0]) == symbol:
+            elif base == symbol:
                 result.append(part)
             else:
                 field = part[0]
@@ -369,15 +493,15 @@ class Or(And):
 
     def inverse(self, symbol, context):
         result = []
-        known_variables = set(context.keys())
+        known_variables = context.keys()
         if (symbol not in self.variables
                 and not known_variables >= self.variables):
             # In this case we don't know anything about this OR part, we
             # consider it to be True (because people will have the constraint
             # on this part later).
             return True
-        for part in self.branches:
-            if isinstance(part, And):
+        for part, base in self.parts:
+            if base is None:
                 part_inversion = part.inverse(symbol, context)
                 evaluated = isinstance(part_inversion, bool)
                 if symbol not in part.variables:
@@ -390,11 +514,10 @@ class Or(And):
                     return True
                 else:
                     continue
-            elif is_leaf(part) and self.base(part[0]) == symbol:
+            elif base == symbol:
                 result.append(part)
             else:
-                field = part[0]
-                field = self.base(field)
+                field = base
                 if (field in context
                         and (eval_leaf(part, context, operator.or_)
                             or constrained_leaf(part, operator.or_))):
@@ -527,6 +650,19 @@ def test_parse():
     assert domain.variables == set('xyz')
 
 
+def test_parse_cache():
+    domain = [['x', '=', 3], ['OR', ['y', '>', 5], ['z', '=', 2]]]
+    assert domain_inversion(domain, 'x') == [['x', '=', 3]]
+    assert domain_inversion(domain, 'x', {'y': 4, 'z': 1}) is False
+    domain[0][2] = 4
+    assert domain_inversion(domain, 'x') == [['x', '=', 4]]
+    domain_inversion(domain, 'x')[0][2] = 5
+    assert domain_inversion(domain, 'x') == [['x', '=', 4]]
+    assert domain_inversion(
+        [['x', '=', 3], ['OR', ['y', '>', 5], ['z', '=', 2]]], 'x') == \
+        [['x', '=', 3]]
+
+
 def test_simplify():
     domain = [['x', '=', 3]]
     assert simplify(domain) == [['x', '=', 3]]
@@ -738,6 +874,28 @@ def test_evaldomain():
     assert eval_domain(domain, {'x': ('foo', 1)})
 
 
+def test_eval_domain_column():
+    columns = {
+        'x': [1, 5, None, 10],
+        'y': ['a', 'b', 'c', None],
+        }
+    domain = [['x', '>', 3], ['OR', ['y', '=', 'b'], ['y', '=', None]]]
+    assert eval_domain_column(domain, columns, 4) == [
+        False, True, False, True]
+    domain = ['OR', ['x', '=', 1], ['z.id', '=', 2]]
+    assert eval_domain_column(domain, columns, 4) == [
+        True, False, False, False]
+    assert eval_domain_column([], columns, 4) == [True] * 4
+    for domain in [
+            [['x', 'in', [1, 10]]],
+            [['y', 'like', 'a%']],
+            ['OR', ['x', '<=', 5], ['y', '!=', 'c']],
+            ]:
+        assert eval_domain_column(domain, columns, 4) == [
+            eval_domain(domain, {'x': x, 'y': y})
+            for x, y in zip(columns['x'], columns['y'])]
+
+
 def test_localize():
     domain = [['x', '=', 5]]
     assert localize_domain(domain) == [['x', '=', 5]]
@@ -812,9 +970,11 @@ if __name__ == '__main__':
     test_andand_inversion()
     test_oror_inversion()
     test_parse()
+    test_parse_cache()
     test_simplify()
     test_unique_value()
     test_evaldomain()
+    test_eval_domain_column()
     test_localize()
     test_prepare_reference_domain()
     test_extract_models()
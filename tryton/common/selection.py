@@ -2,11 +2,12 @@
 # this repository contains the full copyright notices and license terms.
 import operator
 import math
+from itertools import compress
 
 from gi.repository import Gdk, GLib, GObject, Gtk
 
 from tryton.common import RPCExecute, RPCException
-from tryton.common import eval_domain
+from tryton.common import eval_domain_column
 
 
 class SelectionMixin(object):
@@ -86,11 +87,6 @@ class SelectionMixin(object):
         if not domain:
             return
 
-        def _value_evaluator(value):
-            return eval_domain(domain, {
-                    self.field_name: value[0],
-                    })
-
         def _model_evaluator(allowed_models):
             def test(value):
                 return value[0] in allowed_models or not allowed_models
@@ -99,9 +95,13 @@ class SelectionMixin(object):
         if field.attrs['type'] == 'reference':
             allowed_models = field.get_models(record)
             evaluator = _model_evaluator(allowed_models)
+            self.selection = list(filter(evaluator, self.selection))
         else:
-            evaluator = _value_evaluator
-        self.selection = list(filter(evaluator, self.selection))
+            # Evaluate the domain over all the values at once
+            values = [v[0] for v in self.selection]
+            mask = eval_domain_column(
+                domain, {self.field_name: values}, len(values))
+            self.selection = list(compress(self.selection, mask))
 
     def get_inactive_selection(self, value):
         if 'relation' not in self.attrs:
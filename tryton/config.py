@@ -59,10 +59,23 @@ class ConfigManager(object):
             'client.language_direction': 'ltr',
             'client.email': '',
             'client.limit': 1000,
+            'client.virtual_list': False,
+            'client.read_latency': 0.5,
             'client.check_version': False,
             'client.bus_timeout': 10 * 60,
+            'cache.max_size': 50 * 1024 * 1024,
+            'cache.max_entries': 10000,
+            'connection.max': 8,
+            'connection.idle_timeout': 60,
+            'connection.wait_timeout': 5 * 60,
+            'compression.threshold': 1400,  # common MTU
+            'completion.ttl': 5 * 60,
+            'completion.max_entries': 1000,
             'icon.colors': '#0094d2,#57a639,#cc0000',
             'image.max_size': 10 ** 6,
+            'image.cache_size': 32 * 1024 * 1024,
+            'import.batch_size': 1000,
+            'import.workers': 1,
             'bug.url': 'https://support.coopengo.com/',
             'download.url': 'https://downloads.tryton.org/',
             'download.frequency': 60 * 60 * 8,
@@ -147,6 +160,12 @@ class ConfigManager(object):
                     # First convert to float to be backward compatible with old
                     # configuration
                     value = int(float(value))
+                elif section == 'client' and name == 'read_latency':
+                    value = float(value)
+                elif section in {
+                        'cache', 'connection', 'compression', 'completion',
+                        'image', 'import'}:
+                    value = int(value)
                 self.config[section + '.' + name] = value
         return True
 
@@ -21,6 +21,7 @@ from tryton.action import Action
 from tryton.common import RPCExecute, RPCException, RPCContextReload
 from tryton.common.cellrendererclickablepixbuf import \
         CellRendererClickablePixbuf
+from tryton.common.completion import CompletionCache
 from tryton.config import CONFIG, TRYTON_ICON, get_config_dir
 from tryton.exceptions import TrytonError, TrytonServerUnavailable
 from tryton.gui.window import Window
@@ -271,7 +272,7 @@ class Main(Gtk.Application):
         self.last_page = 0
         self.dialogs = []
         self._global_run = False
-        self._global_check_timeout_id = None
+        self._global_callbacks = []
         self._global_update_timeout_id = None
 
         # Register plugins
@@ -297,6 +298,7 @@ class Main(Gtk.Application):
 
     def do_shutdown(self):
         Gtk.Application.do_shutdown(self)
+        common.IconFactory.shutdown()
         common.Logout()
         CONFIG.save()
         Gtk.AccelMap.save(os.path.join(get_config_dir(), 'accel.map'))
@@ -344,80 +346,91 @@ class Main(Gtk.Application):
 
         global_search_completion.connect('match-selected', match_selected)
 
-        def update(widget, search_text, callback=None):
-            def end():
-                self._global_update_timeout_id = None
-                self._global_run = False
-                if callback:
-                    callback()
+        cache = CompletionCache(name=4)
+
+        def display(search_text, result):
+            gmodel = global_search_completion.get_model()
+            gmodel.clear()
+            for r in result:
+                _, model, model_name, record_id, record_name, icon = r
+                if icon:
+                    text = common.to_xml(record_name)
+                    pixbuf = common.IconFactory.get_pixbuf(
+                        icon, Gtk.IconSize.BUTTON)
+                else:
+                    text = '<b>%s:</b>\n %s' % (
+                        common.to_xml(model_name),
+                        common.to_xml(record_name))
+                    pixbuf = None
+                gmodel.append([pixbuf, text, model, record_id, model_name])
+            gmodel.search_text = search_text
+            # Force display of popup
+            self.global_search_entry.emit('changed')
+
+        def end():
+            callbacks, self._global_callbacks = self._global_callbacks, []
+            for callback in callbacks:
+                callback()
+
+        def update(widget, callback=None):
+            self._global_update_timeout_id = None
+            if callback:
+                self._global_callbacks.append(callback)
+            if self._global_run:
+                # Only one query runs on the server, the text is searched
+                # when it ends
                 return False
-            if search_text != widget.get_text():
-                return end()
+            search_text = widget.get_text()
             gmodel = global_search_completion.get_model()
             if not search_text or not gmodel:
                 gmodel.clear()
                 gmodel.search_text = search_text
-                return end()
+                end()
+                return False
             if getattr(gmodel, 'search_text', None) == search_text:
-                return end()
+                end()
+                return False
+            limit = CONFIG['client.limit']
+            context = self.menu_screen.context
+            key = cache.key('ir.model', self.menu_screen.model_name,
+                context, None)
+            result = cache.get(key, search_text)
+            if result is not None:
+                display(search_text, result)
+                end()
+                return False
+            # Show the matching results of a shorter text while searching
+            result = cache.refine(key, search_text)
+            if result:
+                display(search_text, result)
+                gmodel.search_text = None
 
             def set_result(result):
+                self._global_run = False
                 try:
                     result = result()
                 except RPCException:
                     result = []
+                else:
+                    cache.set(key, search_text, result, len(result) < limit)
                 if search_text != widget.get_text():
-                    self._global_update_timeout_id = None
-                    self._global_run = False
-                    if callback:
-                        callback()
-                    return False
-                gmodel.clear()
-                for r in result:
-                    _, model, model_name, record_id, record_name, icon = r
-                    if icon:
-                        text = common.to_xml(record_name)
-                        pixbuf = common.IconFactory.get_pixbuf(
-                            icon, Gtk.IconSize.BUTTON)
-                    else:
-                        text = '<b>%s:</b>\n %s' % (
-                            common.to_xml(model_name),
-                            common.to_xml(record_name))
-                        pixbuf = None
-                    gmodel.append([pixbuf, text, model, record_id, model_name])
-                gmodel.search_text = search_text
-                # Force display of popup
-                widget.emit('changed')
+                    # The result is obsolete
+                    update(widget)
+                    return
+                display(search_text, result)
                 end()
 
             self._global_run = True
             RPCExecute('model', 'ir.model', 'global_search', search_text,
-                CONFIG['client.limit'], self.menu_screen.model_name,
-                context=self.menu_screen.context, callback=set_result)
+                limit, self.menu_screen.model_name, context=context,
+                callback=set_result)
             return False
 
-        def check_timeout(widget, search_text):
-            # This method tries to avoid multiple global_search queries running
-            # concurrently on the server by waiting that one is complete before
-            # sending another. If a query is made while another is already
-            # waiting, it replaces it. Ideally there should be locks on _global
-            # attributes updates, but it does not seem mandatory so we will add
-            # them later if needed
-            if self._global_run:
-                if self._global_check_timeout_id:
-                    GLib.source_remove(self._global_check_timeout_id)
-                self._global_check_timeout_id = GLib.timeout_add(500,
-                    check_timeout, widget, search_text)
-                return True
-            else:
-                self._global_update_timeout_id = GLib.timeout_add(500,
-                    update, widget, search_text)
-                self._global_check_timeout_id = None
-                return False
-
         def changed(widget):
-            search_text = widget.get_text()
-            check_timeout(widget, search_text)
+            if self._global_update_timeout_id:
+                GLib.source_remove(self._global_update_timeout_id)
+            self._global_update_timeout_id = GLib.timeout_add(
+                300, update, widget)
 
         def activate(widget):
             def message():
@@ -426,8 +439,9 @@ class Main(Gtk.Application):
                     common.message(_('No result found.'))
                 else:
                     widget.emit('changed')
-            search_text = widget.get_text()
-            update(widget, search_text, message)
+            if self._global_update_timeout_id:
+                GLib.source_remove(self._global_update_timeout_id)
+            update(widget, message)
 
         self.global_search_entry.connect('changed', changed)
         self.global_search_entry.connect('activate', activate)
@@ -542,6 +556,7 @@ class Main(Gtk.Application):
 
         threads = []
         for target in (
+                rpc.validate_cache,
                 common.IconFactory.load_icons,
                 common.MODELACCESS.load_models,
                 common.MODELHISTORY.load_history,
@@ -1,8 +1,6 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-import os
 from itertools import chain
-import tempfile
 import locale
 import logging
 from tryton.common import \
@@ -16,8 +14,9 @@ import decimal
 from decimal import Decimal
 import math
 from tryton.common import RPCExecute, RPCException
-from tryton.pyson import PYSONDecoder
+from tryton.pyson import PYSONDecoder, compile_pyson
 from tryton.config import CONFIG
+from tryton.blob import Blob, BLOBS
 
 
 class Field(object):
@@ -28,6 +27,7 @@ class Field(object):
     set_client: save the value from the widget
     '''
     _default = None
+    _states_depends = (None, None)
 
     @staticmethod
     def get_field(ctype):
@@ -187,8 +187,30 @@ class Field(object):
         record.modified_fields.setdefault(self.name)
         self.set(record, value)
 
+    def states_depends(self, fields):
+        """Return the names of the fields read by the states
+        or None if they read other values"""
+        states = self.attrs.get('states')
+        key = (states, len(fields))
+        if self._states_depends[0] == key:
+            return self._states_depends[1]
+        depends = []
+        if states and isinstance(states, str):
+            keys = compile_pyson(states).keys
+            for name in (keys if keys is not None else [None]):
+                if name in {'id', 'active_id', 'active_model'}:
+                    continue
+                elif (name in fields
+                        and not isinstance(fields[name], O2MField)):
+                    depends.append(name)
+                else:
+                    depends = None
+                    break
+        self._states_depends = (key, depends)
+        return depends
+
     def state_set(self, record, states=('readonly', 'required', 'invisible')):
-        state_changes = record.expr_eval(self.attrs.get('states', {}))
+        state_changes = record.get_states(self)
         for key in states:
             if key == 'readonly' and self.attrs.get(key, False):
                 continue
@@ -765,12 +787,18 @@ class O2MField(Field):
                 ldomain = []
             else:
                 ldomain = [('id', '=', None)]
-        for record2 in record.value.get(self.name, []):
-            if not record2.loaded and record2.id >= 0 and not pre_validate:
-                continue
+        group = record.value.get(self.name) or []
+        records = [r for r in group
+            if r.loaded or r.id < 0 or pre_validate]
+        for record2 in records:
             if not record2.validate(softvalidation=softvalidation,
                     pre_validate=ldomain):
                 invalid = 'children'
+        # The validation of the fields checks only the domain inverted on
+        # each of them
+        if ldomain and records and not all(
+                group.eval_domain(ldomain, records)):
+            invalid = 'children'
         test = super(O2MField, self).validate(record, softvalidation,
             pre_validate)
         if test and invalid:
@@ -914,27 +942,25 @@ class ReferenceField(Field):
             concat(screen_domain, attr_domain), self.name)
 
 
-class _FileCache(object):
-    def __init__(self, path):
-        self.path = path
-
-    def __del__(self):
-        try:
-            os.remove(self.path)
-        except IOError:
-            pass
-
-
 class BinaryField(Field):
+    "Binary values kept in the blob store and read as memory maps"
 
     _default = None
 
+    def set(self, record, value):
+        previous = record.value.get(self.name)
+        if isinstance(previous, Blob) and previous is not value:
+            previous.release()
+        if isinstance(value, (str, bytes, bytearray)) and value:
+            # The values read are not kept in memory
+            value = BLOBS.add(value)
+        super(BinaryField, self).set(record, value)
+
     def get(self, record):
         result = record.value.get(self.name, self._default)
-        if isinstance(result, _FileCache):
+        if isinstance(result, Blob):
             try:
-                with open(result.path, 'rb') as fp:
-                    result = fp.read()
+                result = result.read()
             except IOError:
                 result = self.get_data(record)
         return result
@@ -943,13 +969,8 @@ class BinaryField(Field):
         return self.get(record)
 
     def set_client(self, record, value, force_change=False):
-        _, filename = tempfile.mkstemp(prefix='tryton_')
-        data = value or b''
-        if isinstance(data, str):
-            data = data.encode('utf-8')
-        with open(filename, 'wb') as fp:
-            fp.write(data)
-        self.set(record, _FileCache(filename))
+        "Store the value which may also be a file object read by chunks"
+        self.set(record, BLOBS.add(value or b''))
         record.modified_fields.setdefault(self.name)
         record.signal('record-modified')
         self.sig_changed(record)
@@ -958,15 +979,15 @@ class BinaryField(Field):
 
     def get_size(self, record):
         result = record.value.get(self.name) or 0
-        if isinstance(result, _FileCache):
-            result = os.stat(result.path).st_size
+        if isinstance(result, Blob):
+            result = result.size
         elif isinstance(result, (str, bytes)):
             result = len(result)
         return result
 
     def get_data(self, record):
         if not isinstance(record.value.get(self.name),
-                (str, bytes, _FileCache)):
+                (str, bytes, Blob)):
             if record.id < 0:
                 return b''
             context = record.get_context()
@@ -975,15 +996,13 @@ class BinaryField(Field):
                     [record.id], [self.name], context=context)
             except RPCException:
                 return b''
-            _, filename = tempfile.mkstemp(prefix='tryton_')
-            data = values[self.name] or b''
-            if isinstance(data, str):
-                data = data.encode('utf-8')
-            with open(filename, 'wb') as fp:
-                fp.write(data)
-            self.set(record, _FileCache(filename))
+            self.set_data(record, values[self.name])
         return self.get(record)
 
+    def set_data(self, record, data):
+        "Store the data read from the server"
+        self.set(record, data or BLOBS.add(b''))
+
 
 class DictField(Field):
 
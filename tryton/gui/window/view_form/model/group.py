@@ -4,11 +4,26 @@ from .record import Record
 from .field import Field, M2OField, ReferenceField
 from tryton import rpc
 from tryton.signal_event import SignalEvent
-from tryton.common.domain_inversion import is_leaf
-from tryton.common import RPCExecute, RPCException, MODELACCESS
+from tryton.common.domain_inversion import is_leaf, eval_domain_column
+from tryton.common.completion import COMPLETIONS
+from tryton.common import RPCExecute, RPCException, MODELACCESS, \
+    RPCExecuteBatch, EvalEnvironment
 from tryton.pyson import PYSONDecoder
 
 
+class _Columns(dict):
+    "Evaluation values of the records by field name computed on demand"
+
+    def __init__(self, records):
+        super(_Columns, self).__init__()
+        self.records = records
+
+    def __missing__(self, name):
+        column = self[name] = [
+            EvalEnvironment(r).get(name) for r in self.records]
+        return column
+
+
 class Group(SignalEvent, list):
 
     def __init__(self, model_name, fields, ids=None, parent=None,
@@ -30,6 +45,12 @@ class Group(SignalEvent, list):
         self.fields = {}
         self.load_fields(fields)
         self.current_idx = None
+        self.read_position = 0
+        # Position in the records of the children groups
+        self.children_read_position = 0
+        # Position of the records by their id(), valid below __valid
+        self.__positions = {}
+        self.__valid = 0
         self.load(ids)
         self.record_deleted, self.record_removed = [], []
         self.on_write = set()
@@ -83,6 +104,12 @@ class Group(SignalEvent, list):
             head = self.clean4inversion(head)
         return [head] + self.clean4inversion(tail)
 
+    def eval_domain(self, domain, records=None):
+        "Return the list of the domain boolean value of each record"
+        if records is None:
+            records = self
+        return eval_domain_column(domain, _Columns(records), len(records))
+
     def get_domain(self):
         if not self.domain or not isinstance(self.domain, str):
             return self.domain
@@ -100,6 +127,34 @@ class Group(SignalEvent, list):
 
     domain4inversion = property(__get_domain4inversion)
 
+    def index(self, record, *args):
+        if args:
+            return super(Group, self).index(record, *args)
+        pos = self.__positions.get(id(record))
+        if (pos is None or pos >= self.__valid
+                or super(Group, self).__getitem__(pos) is not record):
+            length = self.__len__()
+            self.__positions.update(zip(
+                    map(id, super(Group, self).__getitem__(
+                            slice(self.__valid, None))),
+                    range(self.__valid, length)))
+            self.__valid = length
+            pos = self.__positions.get(id(record))
+            if (pos is None
+                    or super(Group, self).__getitem__(pos) is not record):
+                raise ValueError('%r is not in group' % record)
+        return pos
+
+    def __contains__(self, record):
+        try:
+            self.index(record)
+        except ValueError:
+            return False
+        return True
+
+    def __invalidate_positions(self, pos=0):
+        self.__valid = min(self.__valid, pos)
+
     def insert(self, pos, record):
         assert record.group is self
         if pos >= 1:
@@ -109,6 +164,7 @@ class Group(SignalEvent, list):
         else:
             record.next[id(self)] = None
         super(Group, self).insert(pos, record)
+        self.__invalidate_positions(pos)
         self.__id2record[record.id] = record
         if not self.lock_signal:
             self.signal('group-list-changed', ('record-added', record, pos))
@@ -119,6 +175,9 @@ class Group(SignalEvent, list):
             self.__getitem__(self.__len__() - 1).next[id(self)] = record
         record.next[id(self)] = None
         super(Group, self).append(record)
+        if self.__valid == self.__len__() - 1:
+            self.__positions[id(record)] = self.__valid
+            self.__valid += 1
         self.__id2record[record.id] = record
         if not self.lock_signal:
             self.signal('group-list-changed', (
@@ -133,7 +192,9 @@ class Group(SignalEvent, list):
             else:
                 self.__getitem__(idx - 1).next[id(self)] = None
         self.signal('group-list-changed', ('record-removed', record, idx))
-        super(Group, self).remove(record)
+        super(Group, self).__delitem__(idx)
+        self.__positions.pop(id(record), None)
+        self.__invalidate_positions(idx)
         del self.__id2record[record.id]
 
     def clear(self):
@@ -147,8 +208,37 @@ class Group(SignalEvent, list):
             self.pop()
             length -= 1
         self.__id2record = {}
+        self.__positions = {}
+        self.__valid = 0
         self.record_removed, self.record_deleted = [], []
 
+    def replace(self, ids):
+        """Set the records of ids as content without signal and return them
+
+        The records removed are not destroyed as they may still be
+        displayed."""
+        records = []
+        for id_ in ids:
+            record = self.get(id_)
+            if not record:
+                record = Record(self.model_name, id_, group=self)
+                record.signal_connect(self, 'record-changed',
+                    self._record_changed)
+                record.signal_connect(self, 'record-modified',
+                    self._record_modified)
+            records.append(record)
+        kept = set(map(id, records))
+        removed = [r for r in self if id(r) not in kept]
+        lock_signal, self.lock_signal = self.lock_signal, True
+        self[:] = records
+        self.lock_signal = lock_signal
+        for record, next_ in zip(records, records[1:] + [None]):
+            record.next[id(self)] = next_
+        self.__id2record = {r.id: r for r in records}
+        for record in removed:
+            record.next.pop(id(self), None)
+        return records
+
     def move(self, record, pos):
         if self.__len__() > pos >= 0:
             idx = self.index(record)
@@ -160,8 +250,31 @@ class Group(SignalEvent, list):
             self._remove(record)
             self.append(record)
 
+    def pop(self, i=-1):
+        if i < 0:
+            i += self.__len__()
+        record = super(Group, self).pop(i)
+        self.__positions.pop(id(record), None)
+        self.__invalidate_positions(i)
+        return record
+
+    def sort(self, *args, **kwargs):
+        super(Group, self).sort(*args, **kwargs)
+        self.__invalidate_positions()
+
+    def reverse(self):
+        super(Group, self).reverse()
+        self.__invalidate_positions()
+
+    def __delitem__(self, i):
+        super(Group, self).__delitem__(i)
+        self.__positions = {}
+        self.__valid = 0
+
     def __setitem__(self, i, value):
         super(Group, self).__setitem__(i, value)
+        self.__positions = {}
+        self.__valid = 0
         if not self.lock_signal:
             self.signal('group-list-changed', ('record-changed', i))
 
@@ -206,6 +319,7 @@ class Group(SignalEvent, list):
                 context=ctx)
         except RPCException:
             return False
+        COMPLETIONS.expire(self.model_name)
         if reload_ids:
             root_group.reload(reload_ids)
         return True
@@ -220,6 +334,7 @@ class Group(SignalEvent, list):
         return root
 
     def written(self, ids):
+        COMPLETIONS.expire(self.model_name)
         if isinstance(ids, int):
             ids = [ids]
         ids = [x for x in self.on_write_ids(ids) or [] if x not in ids]
@@ -240,12 +355,17 @@ class Group(SignalEvent, list):
         if not self.on_write:
             return []
         res = []
-        for fnct in self.on_write:
-            try:
-                res += RPCExecute('model', self.model_name, fnct, ids,
-                    context=self.context)
-            except RPCException:
-                return []
+        try:
+            results = RPCExecuteBatch(
+                [('model', self.model_name, fnct, ids)
+                    for fnct in self.on_write],
+                context=self.context)
+        except RPCException:
+            return []
+        for result in results:
+            # The failure of an on_write does not discard the others
+            if result is not None:
+                res += result
         return list({}.fromkeys(res))
 
     def load(self, ids, modified=False):
@@ -524,3 +644,63 @@ class Group(SignalEvent, list):
             if not isinstance(group, Group):
                 return None
         return record
+
+
+def test_eval_domain():
+    from tryton.common.domain_inversion import eval_domain
+    group = Group('test', {
+            'x': {'name': 'x', 'type': 'integer'},
+            'y': {'name': 'y', 'type': 'char'},
+            })
+    group.load([1, 2, 3, 4])
+    for record, (x, y) in zip(group, [
+                (1, 'a'), (5, 'b'), (None, 'c'), (10, None)]):
+        record.set({'x': x, 'y': y}, validate=False)
+    for domain in [
+            [],
+            [['x', '>', 3]],
+            [['x', '>', 3], ['OR', ['y', '=', 'b'], ['y', '=', None]]],
+            ['OR', ['x', 'in', [1, 10]], ['y', 'like', 'c%']],
+            [['id', '!=', 2], ['x', '!=', None]],
+            ]:
+        assert group.eval_domain(domain) == [
+            eval_domain(domain, EvalEnvironment(r)) for r in group]
+    assert group.eval_domain([['x', '>', 3]], group[1:3]) == [True, False]
+
+
+def test_index():
+    group = Group('test', {})
+    group.load(list(range(1, 21)))
+
+    def check():
+        for record in group:
+            assert group.index(record) == list.index(group, record)
+
+    check()
+    group.insert(3, Record('test', -1, group=group))
+    check()
+    group.append(Record('test', -2, group=group))
+    check()
+    group.pop(5)
+    check()
+    group.pop()
+    check()
+    group.sort(key=lambda r: -r.id)
+    check()
+    group.reverse()
+    check()
+    del group[2]
+    check()
+    del group[4:8]
+    check()
+    group[1] = group[-1]
+    group.pop()
+    check()
+    group[:] = group[::2]
+    check()
+    group.move(group[0], 3)
+    check()
+    removed = group[2]
+    group._remove(removed)
+    check()
+    assert removed not in group
@@ -1,6 +1,9 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import bisect
+import itertools
 import logging
+import time
 from tryton.signal_event import SignalEvent
 from tryton.pyson import PYSONDecoder
 import tryton.common as common
@@ -9,6 +12,169 @@ from tryton.common import RPCExecute, RPCException
 from tryton.config import CONFIG
 
 
+class ReadBatch(object):
+    """Size the eager read batches from the measured reads
+
+    The duration of a read of a model is modelled as a fixed round trip
+    cost plus a cost per cell (record × field) fitted on the last reads. The
+    cells of a batch fill the client.read_latency budget, or the round trip
+    when it is longer so that it is amortized over the batch. The batches
+    have at least min_size records and at most client.limit cells or
+    max_bytes of values."""
+    decay = 0.8
+    max_bytes = 4 * 1024 * 1024
+
+    def __init__(self, min_size=10):
+        self.min_size = min_size
+        self.models = {}
+        self.cell_bytes = {}
+
+    def limit(self, model, nfields):
+        upper = int(CONFIG['client.limit'] / nfields)
+        if self.cell_bytes.get(model):
+            upper = min(upper,
+                int(self.max_bytes / self.cell_bytes[model] / nfields))
+        lower = min(self.min_size, CONFIG['client.limit'])
+        default = max(upper, lower)
+        if model not in self.models:
+            return default
+        weight, sum_x, sum_y, sum_xx, sum_xy = self.models[model]
+        mean_x, mean_y = sum_x / weight, sum_y / weight
+        variance = sum_xx / weight - mean_x ** 2
+        if variance > 0:
+            cell_cost = (sum_xy / weight - mean_x * mean_y) / variance
+            round_trip = mean_y - cell_cost * mean_x
+        else:
+            cell_cost, round_trip = mean_y / mean_x, 0
+        if cell_cost <= 0:
+            return default
+        budget = max(CONFIG['client.read_latency'], round_trip)
+        size = int(budget / cell_cost / nfields)
+        return max(min(size, upper), lower)
+
+    def update(self, model, cells, duration, size=None):
+        "Add the read of cells in duration seconds returning size bytes"
+        if not cells:
+            return
+        values = self.models.get(model, (0, 0, 0, 0, 0))
+        values = [v * self.decay for v in values]
+        for i, value in enumerate(
+                (1, cells, duration, cells * cells, cells * duration)):
+            values[i] += value
+        self.models[model] = tuple(values)
+        if size is not None:
+            cell_bytes = size / cells
+            if model in self.cell_bytes:
+                cell_bytes += self.decay * (
+                    self.cell_bytes[model] - cell_bytes)
+            self.cell_bytes[model] = cell_bytes
+
+    @staticmethod
+    def measure(rows):
+        "Return the approximate size in bytes of the values of the rows"
+        size = 0
+        for row in rows:
+            for value in row.values() if isinstance(row, dict) else row:
+                if isinstance(value, (str, bytes)):
+                    size += len(value)
+                else:
+                    size += 8
+        return size
+
+
+READ_BATCH = ReadBatch()
+
+
+class _Siblings(object):
+    "Read-only concatenation of the sibling groups without copying them"
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.offsets = list(itertools.accumulate(
+                [0] + [len(g) for g in groups[:-1]]))
+        self.length = sum(len(g) for g in groups)
+        self.group_offsets = {id(g): o for g, o in zip(groups, self.offsets)}
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        n = bisect.bisect_right(self.offsets, i) - 1
+        return self.groups[n][i - self.offsets[n]]
+
+    def __contains__(self, record):
+        return (id(record.group) in self.group_offsets
+            and record in record.group)
+
+    def index(self, record):
+        return (self.group_offsets[id(record.group)]
+            + record.group.index(record))
+
+
+class _Value(dict):
+    "Values of a record which count their changes"
+    version = 0
+
+    def __init__(self, *args, **kwargs):
+        super(_Value, self).__init__(*args, **kwargs)
+        self.versions = {}
+        self.cleared = 0
+
+    def _changed(self, keys):
+        self.version += 1
+        for key in keys:
+            self.versions[key] = self.version
+
+    def key_version(self, key):
+        "Return the version of the last change of the key"
+        return max(self.versions.get(key, 0), self.cleared)
+
+    def __setitem__(self, key, value):
+        self._changed([key])
+        super(_Value, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._changed([key])
+        super(_Value, self).__delitem__(key)
+
+    def setdefault(self, key, default=None):
+        self._changed([key])
+        return super(_Value, self).setdefault(key, default)
+
+    def pop(self, key, *args):
+        self._changed([key])
+        return super(_Value, self).pop(key, *args)
+
+    def popitem(self):
+        key, value = super(_Value, self).popitem()
+        self._changed([key])
+        return key, value
+
+    def update(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        self._changed(values)
+        super(_Value, self).update(values)
+
+    def clear(self):
+        self._changed([])
+        self.cleared = self.version
+        super(_Value, self).clear()
+
+
+class _EvalContext(dict):
+    "Evaluation context which computes the record context only if read"
+
+    def __init__(self, record, values):
+        super(_EvalContext, self).__init__(values)
+        self.record = record
+
+    def get(self, key, default=None):
+        if key == 'context' and not super(_EvalContext, self).__contains__(
+                'context'):
+            self['context'] = self.record.get_context()
+        return super(_EvalContext, self).get(key, default)
+
+
 class Record(SignalEvent):
 
     # JCA : Make sure we cannot have id conflicts in case of bugs on temporary
@@ -34,7 +200,9 @@ class Record(SignalEvent):
         self.resources = None
         self.button_clicks = {}
         self.next = {}  # Used in Group list
-        self.value = {}
+        self.value = _Value()
+        self._eval_cache = None
+        self._states_cache = {}
         self.autocompletion = {}
         self.exception = False
         self.destroyed = False
@@ -79,20 +247,24 @@ class Record(SignalEvent):
 
             record_context = self.get_context()
             if loading == 'eager':
-                limit = int(CONFIG['client.limit'] / len(fnames))
+                limit = READ_BATCH.limit(self.model_name, len(fnames))
 
                 def filter_group(record):
                     return name not in record._loaded and record.id >= 0
 
+                # The context depends only on the group
+                same_context = {id(self.group): True}
+
                 def filter_parent_group(record):
-                    return (filter_group(record)
-                        and record.id not in id2record
-                        and ((record.group == self.group)
-                            # Don't compute context for same group
-                            or (record.get_context() == record_context)))
+                    if not filter_group(record) or record.id in id2record:
+                        return False
+                    if id(record.group) not in same_context:
+                        same_context[id(record.group)] = (
+                            record.get_context() == record_context)
+                    return same_context[id(record.group)]
 
                 if self.parent and self.parent.model_name == self.model_name:
-                    group = sum(self.parent.group.children, [])
+                    group = _Siblings(self.parent.group.children)
                     filter_ = filter_parent_group
                 else:
                     group = self.group
@@ -100,18 +272,30 @@ class Record(SignalEvent):
                 if self in group:
                     idx = group.index(self)
                     length = len(group)
-                    n = 1
-                    while len(id2record) < limit and (idx - n >= 0
-                            or idx + n < length) and n < 2 * limit:
-                        if idx - n >= 0:
-                            record = group[idx - n]
-                            if filter_(record):
-                                id2record[record.id] = record
-                        if idx + n < length:
-                            record = group[idx + n]
-                            if filter_(record):
-                                id2record[record.id] = record
-                        n += 1
+                    # Prefetch more records in the scrolling direction
+                    if isinstance(group, _Siblings):
+                        owner = self.parent.group
+                        step = -1 if idx < owner.children_read_position else 1
+                        owner.children_read_position = idx
+                    else:
+                        step = -1 if idx < group.read_position else 1
+                        group.read_position = idx
+                    ahead = behind = 1
+                    while (len(id2record) < limit and ahead < 3 * limit
+                            and (0 <= idx - behind * step < length
+                                or 0 <= idx + ahead * step < length)):
+                        for i in (idx + ahead * step,
+                                idx + (ahead + 1) * step,
+                                idx + (ahead + 2) * step,
+                                idx - behind * step):
+                            if len(id2record) >= limit:
+                                break
+                            if 0 <= i < length:
+                                record = group[i]
+                                if filter_(record):
+                                    id2record[record.id] = record
+                        ahead += 3
+                        behind += 1
 
             ctx = record_context.copy()
             ctx.update(dict(('%s.%s' % (self.model_name, fname), 'size')
@@ -119,8 +303,12 @@ class Record(SignalEvent):
                     if field.attrs['type'] == 'binary' and fname in fnames))
             exception = False
             try:
+                start = time.monotonic()
                 values = RPCExecute('model', self.model_name, 'read',
                     list(id2record.keys()), fnames, context=ctx)
+                READ_BATCH.update(self.model_name,
+                    len(id2record) * len(fnames), time.monotonic() - start,
+                    READ_BATCH.measure(values))
             except RPCException:
                 values = [{'id': x} for x in id2record]
                 default_values = dict((f, None) for f in fnames)
@@ -128,10 +316,10 @@ class Record(SignalEvent):
                     value.update(default_values)
                 self.exception = exception = True
             id2value = dict((value['id'], value) for value in values)
-            for id, record in id2record.items():
+            for id_, record in id2record.items():
                 if not record.exception:
                     record.exception = exception
-                value = id2value.get(id)
+                value = id2value.get(id_)
                 if record and not record.destroyed and value:
                     for key in record.modified_fields:
                         value.pop(key, None)
@@ -280,15 +468,41 @@ class Record(SignalEvent):
                 del value[name]
         return value
 
+    def _get_eval_snapshot(self):
+        """Return the evaluation values of the fields and the names of the
+        one2many fields which are evaluated from the records of their group"""
+        key = (self.value.version, len(self._loaded), self.id,
+            id(self.group), len(self.group.fields))
+        if self._eval_cache is None or self._eval_cache[0] != key:
+            value, lazy = {}, []
+            for name, field in self.group.fields.items():
+                if name not in self._loaded and self.id >= 0:
+                    continue
+                if isinstance(field, fields.O2MField):
+                    lazy.append(name)
+                else:
+                    value[name] = field.get_eval(self)
+            value['id'] = self.id
+            self._eval_cache = (key, value, lazy)
+        return self._eval_cache[1:]
+
     def get_eval(self):
-        value = {}
-        for name, field in self.group.fields.items():
-            if name not in self._loaded and self.id >= 0:
-                continue
-            value[name] = field.get_eval(self)
-        value['id'] = self.id
+        snapshot, lazy = self._get_eval_snapshot()
+        value = snapshot.copy()
+        for name in lazy:
+            value[name] = self.group.fields[name].get_eval(self)
         return value
 
+    def get_eval_value(self, name):
+        snapshot, lazy = self._get_eval_snapshot()
+        if name in lazy:
+            return self.group.fields[name].get_eval(self)
+        return snapshot[name]
+
+    def has_eval_value(self, name):
+        snapshot, lazy = self._get_eval_snapshot()
+        return name in snapshot or name in lazy
+
     def get_on_change_value(self, skip=None):
         value = {}
         for name, field in self.group.fields.items():
@@ -511,8 +725,10 @@ class Record(SignalEvent):
             return []
         elif expr == '{}':
             return {}
-        ctx = self.get_eval()
-        ctx['context'] = self.get_context()
+        snapshot, lazy = self._get_eval_snapshot()
+        ctx = _EvalContext(self, snapshot)
+        for name in lazy:
+            ctx[name] = self.group.fields[name].get_eval(self)
         ctx['active_model'] = self.model_name
         ctx['active_id'] = self.id
         if self.parent and self.parent_name:
@@ -521,6 +737,23 @@ class Record(SignalEvent):
         val = PYSONDecoder(ctx).decode(expr)
         return val
 
+    def get_states(self, field):
+        """Return the evaluated states of the field
+
+        The result is kept until one of the fields read by the states
+        changes."""
+        states = field.attrs.get('states', {})
+        keys = field.states_depends(self.group.fields)
+        if keys is None:
+            return self.expr_eval(states)
+        stamp = (states, self.id,
+            tuple(self.value.key_version(k) for k in keys))
+        cache = self._states_cache.get(field.name)
+        if cache is None or cache[0] != stamp:
+            cache = self._states_cache[field.name] = (
+                stamp, self.expr_eval(states))
+        return cache[1]
+
     def _get_on_change_args(self, args):
         res = {}
         values = common.EvalEnvironment(self, 'on_change')
@@ -666,3 +899,35 @@ class Record(SignalEvent):
                 v.destroy()
         super(Record, self).destroy()
         self.destroyed = True
+
+
+def test_eval_snapshot():
+    from tryton.pyson import PYSONEncoder, Eval
+    from .group import Group
+    parent_group = Group('parent', {
+            'name': {'name': 'name', 'type': 'char'},
+            })
+    parent_group.load([1])
+    parent, = parent_group
+    parent.set({'name': 'foo'}, validate=False)
+    group = Group('child', {
+            'code': {'name': 'code', 'type': 'char'},
+            }, parent=parent, parent_name='parent')
+    group.load([2])
+    record, = group
+    record.set({'code': 'a'}, validate=False)
+    parent_name = PYSONEncoder().encode(
+        Eval('_parent_parent', {}).get('name'))
+
+    snapshot, _ = record._get_eval_snapshot()
+    assert record._get_eval_snapshot()[0] is snapshot
+    assert record.expr_eval(parent_name) == 'foo'
+
+    record.set_on_change({'code': 'b'})
+    assert record._get_eval_snapshot()[0] is not snapshot
+    assert record.get_eval_value('code') == 'b'
+
+    # The values of the parent are not part of the snapshot
+    parent.set_on_change({'name': 'bar'})
+    assert record.expr_eval(parent_name) == 'bar'
+    assert record.get_eval()['code'] == 'b'
@@ -23,7 +23,7 @@ from tryton.config import CONFIG
 from tryton.jsonrpc import JSONEncoder
 from tryton.common.domain_parser import DomainParser
 from tryton.common import RPCExecute, RPCException, MODELACCESS, \
-    node_attributes, sur, RPCContextReload, warning
+    node_attributes, sur, RPCContextReload, warning, RPCExecuteBatch
 from tryton.action import Action
 from tryton.pyson import PYSONDecoder
 from tryton.rpc import clear_cache
@@ -50,6 +50,9 @@ class Screen(SignalEvent):
                 or MODELACCESS[model_name]['create']):
             self.readonly = True
         self.search_count = 0
+        # The domain, context, order and count of the search browsed by
+        # windows of ids in virtual list mode
+        self.virtual_search = None
         if not attributes.get('row_activate'):
             self.row_activate = self.default_row_activate
         else:
@@ -271,6 +274,9 @@ class Screen(SignalEvent):
         context = self.context
         if self.screen_container.but_active.get_active():
             context['active_test'] = False
+        if not only_ids and self.virtual_list:
+            # The rows are browsed from the first one
+            self.offset = 0
         ids = []
         while True:
             try:
@@ -290,8 +296,11 @@ class Screen(SignalEvent):
                     self.search_count = 0
             else:
                 self.search_count = len(ids)
+        virtual = (not only_ids and self.virtual_list
+            and self.search_count > len(ids))
         self.screen_container.but_prev.set_sensitive(bool(self.offset))
-        if (self.limit is not None
+        if (not virtual
+                and self.limit is not None
                 and len(ids) == self.limit
                 and self.search_count > self.limit + self.offset):
             self.screen_container.but_next.set_sensitive(True)
@@ -300,6 +309,9 @@ class Screen(SignalEvent):
         if only_ids:
             return ids
         self.clear()
+        if virtual:
+            self.virtual_search = (
+                domain, context, self.order, self.search_count)
         self.load(ids)
         self.count_tab_domain()
         return bool(ids)
@@ -345,23 +357,27 @@ class Screen(SignalEvent):
         return domain
 
     def count_tab_domain(self):
-        def set_tab_counter(count, idx):
+        def set_tab_counters(counts, idxs):
             try:
-                count = count()
+                counts = counts()
             except RPCException:
-                count = None
-            self.screen_container.set_tab_counter(count, idx)
+                counts = [None] * len(idxs)
+            for idx, count in zip(idxs, counts):
+                self.screen_container.set_tab_counter(count, idx)
         screen_domain = self.search_domain(self.screen_container.get_text())
+        idxs, calls = [], []
         for idx, (name, (ctx, domain), count) in enumerate(
                 self.screen_container.tab_domain):
             if not count:
                 continue
             decoder = PYSONDecoder(ctx)
             domain = ['AND', decoder.decode(domain), screen_domain]
-            set_tab_counter(lambda: None, idx)
-            RPCExecute('model', self.model_name,
-                'search_count', domain, context=self.context,
-                callback=functools.partial(set_tab_counter, idx=idx))
+            self.screen_container.set_tab_counter(None, idx)
+            idxs.append(idx)
+            calls.append(('model', self.model_name, 'search_count', domain))
+        if calls:
+            RPCExecuteBatch(calls, context=self.context,
+                callback=functools.partial(set_tab_counters, idxs=idxs))
 
     @property
     def context(self):
@@ -1116,8 +1132,20 @@ class Screen(SignalEvent):
 
     def clear(self):
         self.current_record = None
+        self.virtual_search = None
         self.group.clear()
 
+    @property
+    def virtual_list(self):
+        "Whether the rows of the searches can be browsed by windows"
+        view = self.current_view
+        return bool(CONFIG['client.virtual_list']
+            and not self.parent
+            and view and view.view_type == 'tree'
+            and not view.children_field
+            and not view.editable
+            and not view.attributes.get('sequence'))
+
     def on_change(self, fieldname, attr):
         self.current_record.on_change(fieldname, attr)
         self.display()
@@ -2,6 +2,8 @@
 # this repository contains the full copyright notices and license terms.
 import operator
 import gettext
+from collections import defaultdict
+from itertools import chain
 
 from gi.repository import Gtk
 
@@ -12,6 +14,7 @@ from tryton.common import Tooltips, node_attributes, IconFactory, get_align
 from tryton.common.underline import set_underline
 from tryton.common.button import Button
 from tryton.config import CONFIG
+from tryton.gui.window.view_form.model.field import O2MField
 from .form_gtk.calendar_ import Date, Time, DateTime
 from .form_gtk.float import Float
 from .form_gtk.integer import Integer
@@ -399,6 +402,8 @@ class ViewForm(View):
     def __init__(self, view_id, screen, xml):
         self.notebooks = []
         self.expandables = []
+        self._dependents = (None, {})
+        self._displayed = None
 
         vbox = Gtk.VBox()
         vp = Gtk.Viewport()
@@ -482,13 +487,16 @@ class ViewForm(View):
             for field, _, _ in fields:
                 record[field].get(record)
         focused_widget = find_focused_child(self.widget)
-        for name, widgets in self.widgets.items():
+        names = self.widgets
+        if record:
+            names = self._changed_widgets(record)
+        for name in names:
             field = None
             if record:
                 field = record.group.fields.get(name)
             if field:
                 field.state_set(record)
-            for widget in widgets:
+            for widget in self.widgets[name]:
                 widget.display()
         for widget in self.state_widgets:
             widget.state_set(record)
@@ -500,6 +508,55 @@ class ViewForm(View):
                     new_focused_widget.grab_focus()
         return True
 
+    def _get_dependents(self, fields):
+        """Return the names of the widgets to display by field name
+
+        The widgets to always display are under None."""
+        key = len(fields)
+        if self._dependents[0] == key:
+            return self._dependents[1]
+        dependents = defaultdict(set)
+        for name in self.widgets:
+            field = fields.get(name)
+            depends = None
+            if field and not isinstance(field, O2MField):
+                depends = field.states_depends(fields)
+            if depends is None:
+                dependents[None].add(name)
+                continue
+            for depend in chain([name], depends,
+                    field.attrs.get('depends') or [],
+                    field.attrs.get('selection_change_with') or []):
+                dependents[depend].add(name)
+        self._dependents = (key, dependents)
+        return dependents
+
+    def _changed_widgets(self, record):
+        "Return the names of the widgets to display for the record"
+        value = record.value
+        attrs = {n: (a.get('invalid'), a.get('domain_readonly'))
+            for n, a in record.state_attrs.items()}
+        stamp = (
+            record.id, record.readonly, record.group.readonly, value.cleared)
+        displayed, self._displayed = self._displayed, (
+            record, value, stamp, value.version, attrs)
+        if (displayed is None
+                or displayed[0] is not record
+                or displayed[1] is not value
+                or displayed[2] != stamp):
+            return self.widgets
+        dependents = self._get_dependents(record.group.fields)
+        names = set(dependents.get(None, ()))
+        version = displayed[3]
+        for key, key_version in value.versions.items():
+            if key_version > version:
+                # The related values are stored under "name."
+                names.update(dependents.get(key.split('.')[0], ()))
+        for name, state in attrs.items():
+            if displayed[4].get(name) != state:
+                names.update(dependents.get(name, ()))
+        return [n for n in self.widgets if n in names]
+
     def set_cursor(self, new=False, reset_view=True):
         focus_widget = None
         if reset_view or not self.widget.has_focus():
@@ -10,6 +10,7 @@ from gi.repository import Gdk, Gtk
 from tryton.common import common
 from tryton.common import file_selection, Tooltips, file_open, file_write
 from tryton.common.entry_position import reset_position
+from tryton.gui.window.view_form.model.field import BinaryField
 from .widget import Widget
 
 _ = gettext.gettext
@@ -101,13 +102,18 @@ class BinaryMixin(Widget):
 
     def _set_uri(self, uri):
         uri = unquote(uri)
-        self.field.set_client(self.record, urlopen(uri).read())
+        with urlopen(uri) as fp:
+            if isinstance(self.field, BinaryField):
+                # Binary fields read the file by chunks
+                self.field.set_client(self.record, fp)
+            else:
+                self.field.set_client(self.record, fp.read())
         if self.filename_field:
             self.filename_field.set_client(self.record,
                 os.path.basename(urlparse(uri).path))
 
     def get_data(self):
-        if hasattr(self.field, 'get_data'):
+        if isinstance(self.field, BinaryField):
             data = self.field.get_data(self.record)
         else:
             data = self.field.get(self.record)
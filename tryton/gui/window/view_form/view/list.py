@@ -6,7 +6,7 @@ import locale
 import gettext
 import ast
 import logging
-from functools import wraps
+from functools import partial, wraps
 
 from gi.repository import Gdk, GLib, GObject, Gtk, Pango
 from pygtkcompat.generictreemodel import GenericTreeModel
@@ -24,7 +24,7 @@ from . import View, XMLViewParser
 from .list_gtk.editabletree import EditableTreeView, TreeView
 from .list_gtk.widget import (Affix, Char, Text, Int, Boolean, URL, Date,
     Time, Float, TimeDelta, Binary, M2O, O2O, O2M, M2M, Selection, Reference,
-    ProgressBar, Button, Image)
+    ProgressBar, Button, Image, CellCaches)
 
 _ = gettext.gettext
 logger = logging.getLogger(__name__)
@@ -63,6 +63,7 @@ def path_convert_id2pos(model, id_path):
 
 
 class AdaptModelGroup(GenericTreeModel):
+    virtual_search = None
 
     def __init__(self, group, children_field=None, children_definitions=None):
         super(AdaptModelGroup, self).__init__()
@@ -70,6 +71,7 @@ class AdaptModelGroup(GenericTreeModel):
         self.set_property('leak_references', False)
         self.children_field = children_field
         self.children_definitions = children_definitions or []
+        self.cell_caches = CellCaches()
         self.__removed = None  # XXX dirty hack to allow update of has_child
 
     def added(self, group, record):
@@ -269,6 +271,224 @@ class AdaptModelGroup(GenericTreeModel):
         return record.parent
 
 
+class VirtualModelGroup(AdaptModelGroup):
+    """Rows of the search of the screen fetched by windows of ids
+
+    The group of the screen contains only the records of the fetched
+    windows and those added to it, which are shown after the rows of the
+    search. The rows of a window are empty until its search returns. The
+    windows far from the requested rows are evicted."""
+    max_windows = 5
+
+    def __init__(self, screen, previous=None):
+        super(VirtualModelGroup, self).__init__(screen.group)
+        self.screen = screen
+        self.virtual_search = screen.virtual_search
+        self.size = screen.limit
+        self.loading = set()
+        if (isinstance(previous, VirtualModelGroup)
+                and previous.virtual_search is self.virtual_search):
+            # Continue with the rows of the previous model
+            previous.virtual_search = None
+            self.search_count = previous.search_count
+            self.windows = previous.windows
+            self.added_records = previous.added_records
+        else:
+            self.search_count = self.virtual_search[3]
+            self.windows = {0: [r.id for r in self.group if r.id >= 0]}
+            self.added_records = [r for r in self.group if r.id < 0]
+        self.rows = {}
+        self._index()
+
+    @property
+    def count(self):
+        return self.search_count + len(self.added_records)
+
+    def _index(self):
+        self.rows = {id_: n * self.size + i
+            for n, window in self.windows.items()
+            for i, id_ in enumerate(window)}
+
+    def added(self, group, record):
+        if (group is not self.group
+                or record.id in self.rows
+                or record in self.added_records):
+            return
+        self.added_records.append(record)
+        path = (self.count - 1,)
+        self.row_inserted(path, self.get_iter(path))
+
+    def removed(self, group, record):
+        if group is not self.group:
+            return
+        if record in self.added_records:
+            row = self.search_count + self.added_records.index(record)
+            self.added_records.remove(record)
+        elif record.id in self.rows:
+            row = self.rows[record.id]
+            self.search_count -= 1
+            # The windows from the row are shifted on the server
+            for n in [n for n in self.windows if n >= row // self.size]:
+                del self.windows[n]
+            self._index()
+        else:
+            return
+        self.row_deleted((row,))
+
+    def fetch(self, n):
+        "Search the ids of the nth window in the background"
+        if n in self.windows or n in self.loading:
+            return
+        self.loading.add(n)
+        domain, context, order, _ = self.virtual_search
+        try:
+            RPCExecute('model', self.group.model_name, 'search',
+                domain, n * self.size, self.size, order, context=context,
+                callback=partial(self.fetched, n))
+        except RPCException:
+            self.loading.discard(n)
+
+    def fetched(self, n, ids):
+        self.loading.discard(n)
+        if self.screen.virtual_search is not self.virtual_search:
+            return
+        try:
+            ids = ids()
+        except RPCException:
+            ids = []
+        self.windows[n] = ids
+        self.evict(n)
+        self._index()
+        current_record = self.screen.current_record
+        ids = [id_ for m in sorted(self.windows) for id_ in self.windows[m]]
+        ids += [r.id for r in self.added_records]
+        ids += [r.id for r in self.group
+            if r is current_record or r.modified]
+        self.group.replace(list(dict.fromkeys(ids)))
+        self.rows_changed(n * self.size + i
+            for i in range(len(self.windows[n])))
+
+    def rows_changed(self, rows):
+        for row in rows:
+            path = (row,)
+            self.row_changed(path, self.get_iter(path))
+
+    def evict(self, current):
+        "Remove the windows the farthest from the current one"
+        for n in sorted(self.windows, key=lambda n: -abs(n - current)):
+            if len(self.windows) <= self.max_windows or n == current:
+                break
+            records = filter(None, map(self.group.get, self.windows[n]))
+            if any(r is self.screen.current_record or r.modified
+                    for r in records):
+                continue
+            del self.windows[n]
+
+    def node(self, row):
+        "Return the record of the row or None if it is not fetched"
+        if row >= self.search_count:
+            return self.added_records[row - self.search_count]
+        n, i = divmod(row, self.size)
+        window = self.windows.get(n, [])
+        if i < len(window):
+            record = self.group.get(window[i])
+            if record is not None:
+                return record
+            # The records of the window are no more in the group
+            del self.windows[n]
+            self._index()
+        return None
+
+    def sort(self, ids=None):
+        "Search again the windows in the order of the screen"
+        domain, context, _, count = self.virtual_search
+        self.virtual_search = self.screen.virtual_search = (
+            domain, context, self.screen.order, count)
+        rows = sorted(self.rows.values())
+        rows += [r for n in self.loading
+            for r in range(n * self.size,
+                min((n + 1) * self.size, self.search_count))]
+        # The searches pending are ignored as they are for the previous order
+        self.loading.clear()
+        self.windows.clear()
+        self._index()
+        self.rows_changed(rows)
+
+    def __len__(self):
+        return self.count
+
+    def get_user_data(self, iter_):
+        # The iters hold the row number so no reference is kept by the model
+        return iter_.user_data - 1
+
+    def set_user_data(self, iter_, row):
+        if row is None:
+            self.invalidate_iter(iter_)
+        else:
+            iter_.user_data = row + 1
+            iter_.stamp = self.stamp
+
+    def on_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY
+
+    def on_get_path(self, node):
+        "Return the path of the row or of the record"
+        if isinstance(node, int):
+            return (node,)
+        if node in self.added_records:
+            return (self.search_count + self.added_records.index(node),)
+        row = self.rows.get(node.id)
+        if row is not None:
+            return (row,)
+
+    def on_get_value(self, row, column):
+        record = self.node(row)
+        if record is None:
+            self.fetch(row // self.size)
+        return record
+
+    def on_get_iter(self, path):
+        if not path or not 0 <= path[0] < self.count:
+            return None
+        return path[0]
+
+    def on_iter_next(self, row):
+        if row is not None:
+            return self.on_get_iter((row + 1,))
+
+    def on_iter_has_child(self, node):
+        return False
+
+    def on_iter_children(self, node):
+        if node is None:
+            return self.on_get_iter((0,))
+
+    def on_iter_n_children(self, node):
+        if node is None:
+            return self.count
+        return 0
+
+    def on_iter_nth_child(self, node, nth):
+        if node is None:
+            return self.on_get_iter((nth,))
+
+    def on_iter_parent(self, node):
+        return None
+
+
+def fetched(setter):
+    "Decorator to show empty the cells of the rows not fetched"
+    @wraps(setter)
+    def wrapper(column, cell, store, iter_, user_data=None):
+        if store.virtual_search is not None:
+            if store.get_value(iter_, 0) is None:
+                cell.set_property('visible', False)
+                return
+            cell.set_property('visible', True)
+        return setter(column, cell, store, iter_, user_data)
+    return wrapper
+
+
 class TreeXMLViewParser(XMLViewParser):
 
     WIDGETS = {
@@ -331,12 +551,14 @@ class TreeXMLViewParser(XMLViewParser):
 
         for prefix in prefixes:
             column.pack_start(prefix.renderer, expand=prefix.expand)
-            column.set_cell_data_func(prefix.renderer, prefix.setter)
+            column.set_cell_data_func(
+                prefix.renderer, fetched(prefix.setter))
         column.pack_start(widget.renderer, expand=True)
-        column.set_cell_data_func(widget.renderer, widget.setter)
+        column.set_cell_data_func(widget.renderer, fetched(widget.setter))
         for suffix in suffixes:
             column.pack_start(suffix.renderer, expand=suffix.expand)
-            column.set_cell_data_func(suffix.renderer, suffix.setter)
+            column.set_cell_data_func(
+                suffix.renderer, fetched(suffix.setter))
 
         self._set_column_widget(column, attributes, align=widget.align)
         self._set_column_width(column, attributes)
@@ -373,7 +595,7 @@ class TreeXMLViewParser(XMLViewParser):
             attributes.get('string', ''), button.renderer)
         column._type = 'button'
         column.name = None
-        column.set_cell_data_func(button.renderer, button.setter)
+        column.set_cell_data_func(button.renderer, fetched(button.setter))
 
         self._set_column_widget(column, attributes, arrow=False)
         self._set_column_width(column, attributes)
@@ -510,6 +732,8 @@ class ViewTree(View):
         self.sum_widgets = []
         self.sum_box = Gtk.HBox()
         self.treeview = None
+        # The sizing of the columns before the virtual list mode
+        self.column_sizings = None
         editable = xml.getAttribute('editable')
         if editable and not screen.readonly:
             # ABD: Pass self.attributes.get('editable_open') to constructor
@@ -598,7 +822,10 @@ class ViewTree(View):
         model = self.treeview.get_model()
         unsaved_records = [x for x in model.group if x.id < 0]
         search_string = self.screen.screen_container.get_text() or ''
-        if (self.screen.search_count == len(model)
+        if model.virtual_search is not None:
+            # Keep the unsaved records which a new search would clear
+            model.sort()
+        elif (self.screen.search_count == len(model)
                 or unsaved_records
                 or self.screen.parent):
             ids = self.screen.search_filter(
@@ -730,6 +957,8 @@ class ViewTree(View):
 
     def copy_foreach(self, treemodel, path, iter, data):
         record = treemodel.get_value(iter, 0)
+        if record is None:
+            return
         values = []
         for col in self.treeview.get_columns():
             if not col.get_visible() or not col.name:
@@ -944,7 +1173,8 @@ class ViewTree(View):
                 elif selection.get_mode() == Gtk.SelectionMode.MULTIPLE:
                     model = selection.get_selected_rows()[0]
                 record = model.get_value(model.get_iter(path), 0)
-                pop(menu, group, record)
+                if record is not None:
+                    pop(menu, group, record)
             menu.show_all()
             if hasattr(menu, 'popup_at_pointer'):
                 menu.popup_at_pointer(event)
@@ -1076,19 +1306,39 @@ class ViewTree(View):
     def display(self, force=False):
         self.treeview.display_counter += 1
         current_record = self.record
+        model = self.treeview.get_model()
         if (force
-                or not self.treeview.get_model()
-                or self.group != self.treeview.get_model().group):
-            model = AdaptModelGroup(self.group, self.children_field,
-                self.children_definitions)
+                or not model
+                or self.group != model.group
+                or self.screen.virtual_search is not model.virtual_search):
+            if self.screen.virtual_search:
+                model = VirtualModelGroup(self.screen, model)
+                if self.column_sizings is None:
+                    # Only the visible rows are measured
+                    self.column_sizings = [(c, c.get_sizing())
+                        for c in self.treeview.get_columns()]
+                    for column, _ in self.column_sizings:
+                        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+                    self.treeview.set_fixed_height_mode(True)
+            else:
+                if self.column_sizings is not None:
+                    self.treeview.set_fixed_height_mode(False)
+                    for column, sizing in self.column_sizings:
+                        column.set_sizing(sizing)
+                    self.column_sizings = None
+                    self.treeview.set_fixed_height_mode(
+                        all(c.get_sizing() == Gtk.TreeViewColumnSizing.FIXED
+                            for c in self.treeview.get_columns()))
+                model = AdaptModelGroup(self.group, self.children_field,
+                    self.children_definitions)
             self.treeview.set_model(model)
             # __select_changed resets current_record to None
             self.record = current_record
             if current_record:
                 selection = self.treeview.get_selection()
-                path = current_record.get_index_path(model.group)
+                path = model.on_get_path(current_record)
                 # JCA : Check selection is not empty before updateing path
-                if selection:
+                if selection and path is not None:
                     selection.select_path(path)
         if not current_record:
             selection = self.treeview.get_selection()
@@ -1194,8 +1444,10 @@ class ViewTree(View):
     def set_cursor(self, new=False, reset_view=True):
         self.treeview.grab_focus()
         model = self.treeview.get_model()
+        path = None
         if self.record and model:
-            path = self.record.get_index_path(model.group)
+            path = model.on_get_path(self.record)
+        if path is not None:
             if model.get_flags() & Gtk.TreeModelFlags.LIST_ONLY:
                 path = (path[0],)
             focus_column, focus_cell = self.treeview.next_column(
@@ -1214,7 +1466,10 @@ class ViewTree(View):
     @property
     def selected_records(self):
         def _func_sel_get(model, path, iter_, records):
-            records.append(model.get_value(iter_, 0))
+            record = model.get_value(iter_, 0)
+            # The rows not fetched have no record
+            if record is not None:
+                records.append(record)
         records = []
         sel = self.treeview.get_selection()
         sel.selected_foreach(_func_sel_get, records)
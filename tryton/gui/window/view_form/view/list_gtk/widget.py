@@ -3,11 +3,14 @@
 import datetime
 import os
 import gettext
+import threading
 import webbrowser
+from collections import OrderedDict
 from functools import wraps, partial
 
 from gi.repository import Gdk, GLib, Gtk
 
+from tryton.blob import BLOBS
 from tryton.gui.window.win_search import WinSearch
 from tryton.gui.window.win_form import WinForm
 from tryton.gui.window.view_form.screen import Screen
@@ -57,18 +60,23 @@ def realized(func):
 
 
 class CellCache(list):
+    "Calls made on a cell renderer packed to be replayed"
 
     methods = ('set_active', 'set_sensitive', 'set_property')
 
-    def apply(self, cell):
-        for method, args, kwargs in self:
-            getattr(cell, method)(*args, **kwargs)
+    @staticmethod
+    def apply(calls, cell):
+        for method, args, kwargs in calls:
+            getattr(cell, method)(*args, **(kwargs or {}))
+
+    def pack(self):
+        return tuple(self)
 
     def decorate(self, cell):
         def decorate(func):
             @wraps(func)
             def wrapper(*args, **kwargs):
-                self.append((func.__name__, args, kwargs))
+                self.append((func.__name__, args, kwargs or None))
                 return func(*args, **kwargs)
             wrapper.previous = func
             return wrapper
@@ -89,29 +97,74 @@ class CellCache(list):
     def cache(cls, func):
         @wraps(func)
         def wrapper(self, column, cell, store, iter_, user_data=None):
-            if not hasattr(self, 'display_counters'):
-                self.display_counters = {}
-            if not hasattr(self, 'cell_caches'):
-                self.cell_caches = {}
+            caches = getattr(store, 'cell_caches', None)
+            if caches is None or getattr(cell, 'decorated', None):
+                return func(self, column, cell, store, iter_, user_data)
             record = store.get_value(iter_, 0)
-            counter = self.view.treeview.display_counter
-            if (self.display_counters.get((record.model_name, record.id)) !=
-                    counter):
-                if getattr(cell, 'decorated', None):
-                    func(self, column, cell, store, iter_, user_data)
-                else:
-                    cache = cls()
-                    cache.decorate(cell)
-                    func(self, column, cell, store, iter_, user_data)
-                    cache.undecorate(cell)
-                    self.cell_caches[(record.model_name, record.id)] = cache
-                    self.display_counters[(record.model_name, record.id)] = \
-                        counter
+            key = (id(self), record.model_name, record.id)
+            calls = caches.get(key, self.view.treeview.display_counter)
+            if calls is None:
+                cache = cls()
+                cache.decorate(cell)
+                func(self, column, cell, store, iter_, user_data)
+                cache.undecorate(cell)
+                caches.set(key, cache.pack(), self.view.treeview)
             else:
-                self.cell_caches[(record.model_name, record.id)].apply(cell)
+                cls.apply(calls, cell)
         return wrapper
 
 
+class CellCaches(object):
+    """Bounded cache of the cell renderer calls of the displayed records
+
+    The cache is emptied when the display counter changes and the least
+    recently drawn cells are evicted once size is reached. The size grows
+    to hold twice the cells of the visible rows."""
+    min_size = 4096
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.cells = set()
+        self.size = self.min_size
+        self.counter = None
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, counter):
+        if counter != self.counter:
+            self.entries.clear()
+            self.counter = counter
+        calls = self.entries.get(key)
+        if calls is None:
+            self.misses += 1
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return calls
+
+    def set(self, key, calls, treeview=None):
+        self.entries[key] = calls
+        self.cells.add(key[0])
+        if len(self.entries) > self.size and treeview is not None:
+            visible = treeview.get_visible_range()
+            if visible:
+                start, end = visible
+                rows = end.get_indices()[0] - start.get_indices()[0] + 1
+                self.size = max(
+                    self.min_size, 2 * len(self.cells) * rows)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            }
+
+
 class Cell(object):
     renderer = None
     setter = None
@@ -634,7 +687,7 @@ class _BinarySelect(_BinaryIcon):
                 filename = file_selection(_('Open...'))
                 if filename:
                     with open(filename, 'rb') as fp:
-                        field.set_client(record, fp.read())
+                        field.set_client(record, fp)
                     if filename_field:
                         filename_field.set_client(
                             record, os.path.basename(filename))
@@ -697,23 +750,12 @@ class Image(GenericText):
         super(Image, self).__init__(view, attrs, renderer)
         self.renderer.set_fixed_size(self.attrs.get('width', -1),
             self.attrs.get('height', -1))
+        self.thumbnails = Thumbnails(self)
 
     @realized
-    @CellCache.cache
     def setter(self, column, cell, store, iter_, user_data=None):
         record, field = self._get_record_field_from_iter(iter_, store)
-        value = field.get_client(record)
-        if isinstance(value, int):
-            if value > CONFIG['image.max_size']:
-                value = None
-            else:
-                value = field.get_data(record)
-        pixbuf = data2pixbuf(value)
-        width = self.attrs.get('width', -1)
-        height = self.attrs.get('height', -1)
-        if pixbuf and (width != -1 or height != -1):
-            pixbuf = common.resize_pixbuf(pixbuf, width, height)
-        cell.set_property('pixbuf', pixbuf)
+        cell.set_property('pixbuf', self.thumbnails.get(record, field))
 
     def get_textual_value(self, record):
         if not record:
@@ -721,6 +763,125 @@ class Image(GenericText):
         return str(record[self.attrs['name']].get_size(record))
 
 
+class Thumbnails(object):
+    """Scaled pixbufs of an image cell
+
+    The images missing for the drawn rows are read in one request, then
+    stored and decoded in a thread. The pixbufs are kept in a LRU bounded by the
+    image.cache_size bytes. Until an image is ready, the cell shows no
+    image."""
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.pixbufs = OrderedDict()
+        self.size = 0
+        self.loading = set()
+        self.pending = []
+
+    def key(self, record, field):
+        return (record.model_name, record.id, field.name,
+            self.cell.attrs.get('width', -1),
+            self.cell.attrs.get('height', -1),
+            record._timestamp, record.value.key_version(field.name))
+
+    def get(self, record, field):
+        key = self.key(record, field)
+        if key in self.pixbufs:
+            self.pixbufs.move_to_end(key)
+            return self.pixbufs[key]
+        if (record.model_name, record.id) not in self.loading:
+            self.loading.add((record.model_name, record.id))
+            if not self.pending:
+                GLib.idle_add(self.load)
+            self.pending.append((record, field))
+
+    def load(self):
+        pending, self.pending = self.pending, []
+        images, reads = [], {}
+        for record, field in pending:
+            if record.destroyed:
+                self.loading.discard((record.model_name, record.id))
+                continue
+            value = field.get_client(record)
+            if isinstance(value, int):
+                if value > CONFIG['image.max_size'] or record.id < 0:
+                    value = None
+                else:
+                    reads.setdefault(
+                        (record.model_name, field.name), []).append(record)
+                    continue
+            images.append((record, self.key(record, field), value))
+        for (model, name), records in reads.items():
+            common.RPCExecute('model', model, 'read',
+                [r.id for r in records], [name],
+                context=records[0].get_context(),
+                callback=partial(self.loaded, records, name))
+        if images:
+            self.start(self.decode, images)
+
+    def loaded(self, records, name, result):
+        try:
+            values = {v['id']: v[name] for v in result()}
+        except common.RPCException:
+            # The images are read again at the next draw
+            for record in records:
+                self.loading.discard((record.model_name, record.id))
+            return
+        fields = [record.group.fields[name] for record in records]
+        images = [(record, self.key(record, field), values.get(record.id))
+            for record, field in zip(records, fields)]
+        self.start(self.store, images, fields)
+
+    @staticmethod
+    def start(target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def store(self, images, fields):
+        "Store the images read outside the main thread before decoding"
+        blobs = [(record, field, BLOBS.add(data or b''))
+            for (record, _, data), field in zip(images, fields)]
+        self.decode(images, blobs)
+
+    def decode(self, images, blobs=()):
+        "Decode and scale the images outside the main thread"
+        width = self.cell.attrs.get('width', -1)
+        height = self.cell.attrs.get('height', -1)
+        pixbufs = []
+        for record, key, data in images:
+            pixbuf = data2pixbuf(data)
+            if pixbuf and (width != -1 or height != -1):
+                pixbuf = common.resize_pixbuf(pixbuf, width, height)
+            pixbufs.append((record, key, pixbuf))
+        GLib.idle_add(self.decoded, pixbufs, blobs)
+
+    def decoded(self, pixbufs, blobs=()):
+        for record, field, blob in blobs:
+            if record.destroyed:
+                blob.release()
+            else:
+                field.set_data(record, blob)
+        for record, key, pixbuf in pixbufs:
+            self.loading.discard((record.model_name, record.id))
+            if key in self.pixbufs:
+                continue
+            self.pixbufs[key] = pixbuf
+            self.size += self._size(pixbuf)
+        while self.size > CONFIG['image.cache_size'] and self.pixbufs:
+            _, pixbuf = self.pixbufs.popitem(last=False)
+            self.size -= self._size(pixbuf)
+        self.cell.view.treeview.queue_draw()
+
+    @staticmethod
+    def _size(pixbuf):
+        # Account also for the key and the slot
+        size = 256
+        if pixbuf is not None:
+            size += pixbuf.get_rowstride() * pixbuf.get_height()
+        return size
+
+
 class M2O(GenericText):
 
     def __init__(self, view, attrs, renderer=None):
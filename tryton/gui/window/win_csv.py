@@ -182,13 +182,18 @@ class WinCSV(NoModal):
         button_cancel.set_image(IconFactory.get_image(
                 'tryton-cancel', Gtk.IconSize.BUTTON))
 
-        button_ok = self.dialog.add_button(
+        self.button_ok = self.dialog.add_button(
             set_underline(_("OK")), Gtk.ResponseType.OK)
-        button_ok.set_image(IconFactory.get_image(
+        self.button_ok.set_image(IconFactory.get_image(
                 'tryton-ok', Gtk.IconSize.BUTTON))
 
+        self.dialog_vbox = dialog_vbox
         self.dialog.vbox.pack_start(
             dialog_vbox, expand=True, fill=True, padding=0)
+        self.progressbar = Gtk.ProgressBar()
+        self.progressbar.set_show_text(True)
+        self.dialog.vbox.pack_start(
+            self.progressbar, expand=False, fill=True, padding=3)
 
         self.view1 = Gtk.TreeView()
         self.view1.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
@@ -219,6 +224,7 @@ class WinCSV(NoModal):
         self.view2.connect('row-activated', self.sig_unsel)
 
         self.dialog.show_all()
+        self.progressbar.hide()
         self.show()
 
         self.register()
@@ -313,6 +319,17 @@ class WinCSV(NoModal):
     def get_quotechar(self):
         return self.csv_quotechar.get_text() or '"'
 
+    def progress_start(self):
+        "Lock the options while the file is processed in the background"
+        self.dialog_vbox.set_sensitive(False)
+        self.button_ok.set_sensitive(False)
+        self.progressbar.set_fraction(0)
+        self.progressbar.show()
+
+    def progress_set(self, fraction, text=None):
+        self.progressbar.set_fraction(min(fraction, 1))
+        self.progressbar.set_text(text)
+
     def get_encoding(self):
         return self.csv_enc.get_active_text() or 'utf_8'
 
@@ -6,16 +6,23 @@ import os
 import tempfile
 import gettext
 import locale
+import threading
+import time
+import traceback
 from numbers import Number
 
-from gi.repository import Gdk, GObject, Gtk
+from gi.repository import Gdk, GLib, GObject, Gtk
 
 import tryton.common as common
+from tryton import rpc
 from tryton.common import RPCExecute, RPCException
+from tryton.exceptions import TrytonServerError
 from tryton.gui.window.win_csv import WinCSV
+from tryton.gui.window.view_form.model.record import ReadBatch
 from tryton.rpc import clear_cache
 
 _ = gettext.gettext
+EXPORT_BATCH = ReadBatch(min_size=100)
 
 
 class WinExport(WinCSV):
@@ -24,6 +31,8 @@ class WinExport(WinCSV):
     def __init__(self, name, model, ids, context=None):
         self.name = name
         self.ids = ids
+        self.exporting = False
+        self.cancelled = False
         self.model = model
         self.context = context
         self.fields = {}
@@ -273,6 +282,10 @@ class WinExport(WinCSV):
         self.model2.append((long_string, name))
 
     def response(self, dialog, response):
+        if self.exporting:
+            # The export is destroyed once the running page is written
+            self.cancelled = True
+            return
         if response == Gtk.ResponseType.OK:
             fields = []
             fields2 = []
@@ -282,60 +295,135 @@ class WinExport(WinCSV):
                 fields2.append(self.model2.get_value(iter, 0))
                 iter = self.model2.iter_next(iter)
             action = self.saveas.get_active()
-            try:
-                data = RPCExecute('model', self.model, 'export_data',
-                    self.ids, fields, context=self.context)
-            except RPCException:
-                data = []
 
             if action == 0:
                 fileno, fname = tempfile.mkstemp(
                     '.csv', common.slugify(self.name) + '_')
-                self.export_csv(fname, fields2, data, popup=False)
                 os.close(fileno)
-                common.file_open(fname, 'csv')
             else:
                 fname = common.file_selection(_('Save As...'),
                         action=Gtk.FileChooserAction.SAVE)
-                if fname:
-                    self.export_csv(fname, fields2, data)
+            if fname:
+                self.export_csv(fname, fields, fields2, open_=action == 0)
+                return
         self.destroy()
 
-    def export_csv(self, fname, fields, data, popup=True):
-        encoding = self.csv_enc.get_active_text() or 'UTF-8'
-        locale_format = self.csv_locale.get_active()
-
+    def export_csv(self, fname, fields, fields2, open_=False):
+        "Write the export to fname by pages in a thread"
+        options = {
+            'encoding': self.csv_enc.get_active_text() or 'UTF-8',
+            'locale_format': self.csv_locale.get_active(),
+            'quotechar': self.get_quotechar(),
+            'delimiter': self.get_delimiter(),
+            'header': fields2 if self.add_field_names.get_active() else None,
+            }
+        context = rpc.CONTEXT.copy()
+        context.update(self.context or {})
+        self.exporting = True
+        self.progress_start()
+        self.start_export(fname, fields, options, context, open_)
+
+    def start_export(self, fname, fields, options, context, open_, i=0,
+            count=0):
+        thread = threading.Thread(target=self._export,
+            args=(fname, fields, options, context, open_, i, count))
+        thread.daemon = True
+        thread.start()
+
+    def _export(self, fname, fields, options, context, open_, i, count):
+        # The export continues in the file from the ith record
+        failure, args = None, None
         try:
-            writer = csv.writer(
-                open(fname, 'w', encoding=encoding, newline=''),
-                quotechar=self.get_quotechar(),
-                delimiter=self.get_delimiter())
-            if self.add_field_names.get_active():
-                writer.writerow(fields)
-            for line in data:
-                row = []
-                for val in line:
-                    if locale_format:
-                        if isinstance(val, Number):
-                            val = locale.str(val)
-                        elif isinstance(val, datetime.datetime):
-                            val = val.strftime(common.date_format() + ' %X')
-                        elif isinstance(val, datetime.date):
-                            val = val.strftime(common.date_format())
-                    elif isinstance(val, bool):
-                        val = int(val)
-                    row.append(val)
-                writer.writerow(row)
-            if popup:
-                if len(data) == 1:
-                    common.message(_('%d record saved.') % len(data))
-                else:
-                    common.message(_('%d records saved.') % len(data))
-            return True
-        except IOError as exception:
+            with open(fname, 'a' if i else 'w', encoding=options['encoding'],
+                    newline='') as fp:
+                writer = csv.writer(fp,
+                    quotechar=options['quotechar'],
+                    delimiter=options['delimiter'])
+                if options['header'] and not i:
+                    writer.writerow(options['header'])
+                while i < len(self.ids) and not self.cancelled:
+                    limit = EXPORT_BATCH.limit(self.model, len(fields) or 1)
+                    ids = self.ids[i:i + limit]
+                    args = ('model', self.model, 'export_data',
+                        ids, fields, context)
+                    start = time.monotonic()
+                    data = rpc.execute(*args)
+                    EXPORT_BATCH.update(self.model, len(ids) * len(fields),
+                        time.monotonic() - start, EXPORT_BATCH.measure(data))
+                    for line in data:
+                        writer.writerow(
+                            self.format_row(line, options['locale_format']))
+                    count += len(data)
+                    i += len(ids)
+                    GLib.idle_add(self.progress_set, i / len(self.ids),
+                        _('%(done)s/%(total)s records') % {
+                            'done': i,
+                            'total': len(self.ids),
+                            })
+        except Exception as exception:
+            failure = (exception, traceback.format_exc(), i, args)
+        GLib.idle_add(self.exported, fname, fields, options, context, open_,
+            count, failure)
+
+    @staticmethod
+    def format_row(line, locale_format):
+        row = []
+        for val in line:
+            if locale_format:
+                if isinstance(val, Number):
+                    val = locale.str(val)
+                elif isinstance(val, datetime.datetime):
+                    val = val.strftime(common.date_format() + ' %X')
+                elif isinstance(val, datetime.date):
+                    val = val.strftime(common.date_format())
+            elif isinstance(val, bool):
+                val = int(val)
+            row.append(val)
+        return row
+
+    def exported(self, fname, fields, options, context, open_, count,
+            failure):
+        resume = False
+        try:
+            if failure:
+                resume = self.failed(*failure)
+            elif self.cancelled:
+                try:
+                    os.remove(fname)
+                except OSError:
+                    pass
+            elif open_:
+                common.file_open(fname, 'csv')
+            elif count == 1:
+                common.message(_('%d record saved.') % count)
+            else:
+                common.message(_('%d records saved.') % count)
+        finally:
+            if resume:
+                # The failed page is exported again by a new thread
+                self.start_export(
+                    fname, fields, options, context, open_, failure[2], count)
+            else:
+                self.exporting = False
+                self.destroy()
+
+    def failed(self, exception, tb, i, args):
+        "Report the failure of the export and return if it must be resumed"
+        if isinstance(exception, IOError):
             common.warning(_("Operation failed.\nError message:\n%s")
                 % exception, _('Error'))
-            return False
+        elif isinstance(exception, TrytonServerError) and not self.cancelled:
+            # The call is resumed by the thread if it is accepted
+            try:
+                common.process_exception(exception, *args,
+                    rpc_execute=lambda *args: True)
+            except RPCException:
+                pass
+            else:
+                return True
+        elif not self.cancelled:
+            common.error(exception, tb)
+        return False
 
     def export_click(self, treeview, event):
         path_at_pos = treeview.get_path_at_pos(int(event.x), int(event.y))
@@ -2,17 +2,29 @@
 # this repository contains the full copyright notices and license terms.
 import csv
 import gettext
+import hashlib
+import json
 import locale
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from decimal import Decimal
 
-from gi.repository import Gtk
+from gi.repository import GLib, Gtk
 
 import tryton.common as common
+from tryton import rpc
 from tryton.common import RPCExecute, RPCException
 from tryton.common.datetime_ import date_parse
+from tryton.config import CONFIG, get_config_dir
+from tryton.exceptions import TrytonServerError, TrytonServerUnavailable
 from tryton.gui.window.win_csv import WinCSV
 
 _ = gettext.gettext
+logger = logging.getLogger(__name__)
+CHECKPOINTS_PATH = os.path.join(get_config_dir(), 'import')
 
 
 class WinImport(WinCSV):
@@ -25,6 +37,8 @@ class WinImport(WinCSV):
         self.fields_data = {}
         self.fields = {}
         self.fields_invert = {}
+        self.importing = False
+        self.cancelled = False
         super(WinImport, self).__init__()
         self.dialog.set_title(_('CSV Import: %s') % name)
 
@@ -170,6 +184,10 @@ class WinImport(WinCSV):
         self.model2.clear()
 
     def response(self, dialog, response):
+        if self.importing:
+            # The import is destroyed once the running batches are done
+            self.cancelled = True
+            return
         if response == Gtk.ResponseType.OK:
             fields = []
             iter = self.model2.get_iter_first()
@@ -180,42 +198,219 @@ class WinImport(WinCSV):
             fname = self.import_csv_file.get_filename()
             if fname:
                 self.import_csv(fname, fields)
+                return
         self.destroy()
 
     def import_csv(self, fname, fields):
+        "Import fname by batches in a thread"
+        options = {
+            'skip': self.csv_skip.get_value_as_int(),
+            'encoding': self.get_encoding(),
+            'locale_format': self.csv_locale.get_active(),
+            'quotechar': self.get_quotechar(),
+            'delimiter': self.get_delimiter(),
+            'batch_size': CONFIG['import.batch_size'],
+            }
+        checkpoint = _Checkpoint(fname, self.model, fields, options)
+        if checkpoint.done and not common.sur(
+                _('A previous import of this file stopped before the end.\n'
+                    'Do you want to resume it?')):
+            checkpoint.clear()
+        context = rpc.CONTEXT.copy()
+        context.update(self.context or {})
+        self.importing = True
+        self.progress_start()
+        thread = threading.Thread(target=self._import,
+            args=(fname, fields, options, context, checkpoint))
+        thread.daemon = True
+        thread.start()
+
+    def read_batches(self, fp, fields, options):
+        """Yield the index, the first line and the rows or the error of the
+        batches of records read from fp"""
         # TODO: make it works with references
-        skip = self.csv_skip.get_value_as_int()
-        encoding = self.get_encoding()
-        locale_format = self.csv_locale.get_active()
-        reader = csv.reader(
-            open(fname, 'r', encoding=encoding),
-            quotechar=self.get_quotechar(),
-            delimiter=self.get_delimiter())
-        data = []
-        for i, line in enumerate(reader):
-            if i < skip or not line:
+        reader = csv.reader(fp,
+            quotechar=options['quotechar'],
+            delimiter=options['delimiter'])
+        # Rows without value for the fields of the model continue the
+        # record of the previous row
+        main = [i for i, f in enumerate(fields) if '/' not in f]
+        index, first, rows, error = 0, None, [], None
+        for i, line in enumerate(reader, 1):
+            if i <= options['skip'] or not line:
                 continue
-            row = []
-            for field, val in zip(fields, line):
-                if locale_format and val:
-                    type_ = self.fields_data[field]['type']
-                    if type_ in ['integer', 'biginteger']:
-                        val = locale.atoi(val)
-                    elif type_ == 'float':
-                        val = locale.atof(val)
-                    elif type_ == 'numeric':
-                        val = locale.atof(val, Decimal)
-                    elif type_ in ['date', 'datetime']:
-                        val = date_parse(val, common.date_format())
-                row.append(val)
-            data.append(row)
+            new = not main or any(
+                j < len(line) and line[j] for j in main)
+            if new and len(rows) >= options['batch_size']:
+                yield index, first, rows, error
+                index, first, rows, error = index + 1, None, [], None
+            if first is None:
+                first = i
+            try:
+                rows.append(self.convert_row(
+                        fields, line, options['locale_format']))
+            except ValueError as exception:
+                if not error:
+                    error = _('Line %(line)s: %(error)s') % {
+                        'line': i,
+                        'error': exception,
+                        }
+        if rows or error:
+            yield index, first, rows, error
+
+    def convert_row(self, fields, line, locale_format):
+        row = []
+        for field, val in zip(fields, line):
+            if locale_format and val:
+                type_ = self.fields_data[field]['type']
+                if type_ in ['integer', 'biginteger']:
+                    val = locale.atoi(val)
+                elif type_ == 'float':
+                    val = locale.atof(val)
+                elif type_ == 'numeric':
+                    val = locale.atof(val, Decimal)
+                elif type_ in ['date', 'datetime']:
+                    val = date_parse(val, common.date_format())
+            row.append(val)
+        return row
+
+    def _import(self, fname, fields, options, context, checkpoint):
+        size = os.path.getsize(fname) or 1
+        report, exception = [], None
+        unavailable = threading.Event()
+
+        def import_data(index, first, rows):
+            start = time.monotonic()
+            try:
+                count = rpc.execute('model', self.model, 'import_data',
+                    fields, rows, context)
+            except TrytonServerError as exception:
+                if exception.faultCode == 'UserError':
+                    error = exception.args[0]
+                else:
+                    error = exception.faultString
+            except TrytonServerUnavailable as exception:
+                # The next batches would fail the same way
+                unavailable.set()
+                error = str(exception) or _('The server is unavailable.')
+            except Exception as exception:
+                error = str(exception) or repr(exception)
+            else:
+                # The batch is recorded before it is reported
+                checkpoint.commit(index)
+                return index, first, count, time.monotonic() - start, None
+            return index, first, None, time.monotonic() - start, error
+
         try:
-            count = RPCExecute(
-                'model', self.model, 'import_data', fields, data,
-                context=self.context)
-        except RPCException:
+            with open(fname, 'r', encoding=options['encoding'],
+                    newline='') as fp, ThreadPoolExecutor(
+                        max(CONFIG['import.workers'], 1)) as executor:
+                running = set()
+                try:
+                    for index, first, rows, error in self.read_batches(
+                            fp, fields, options):
+                        if index in checkpoint.done:
+                            continue
+                        if error:
+                            report.append((index, first, None, 0, error))
+                            continue
+                        if len(running) >= CONFIG['import.workers']:
+                            finished, running = wait(
+                                running, return_when=FIRST_COMPLETED)
+                            report.extend(f.result() for f in finished)
+                        if self.cancelled or unavailable.is_set():
+                            break
+                        running.add(executor.submit(
+                                import_data, index, first, rows))
+                        GLib.idle_add(self.progress_set,
+                            fp.buffer.tell() / size)
+                finally:
+                    # The batches sent are reported even if the reading fails
+                    report.extend(f.result() for f in wait(running)[0])
+        except Exception as e:
+            exception = e
+        GLib.idle_add(self.imported, report, exception, checkpoint)
+
+    def imported(self, report, exception, checkpoint):
+        self.importing = False
+        if isinstance(exception, IOError):
+            common.warning(_("Operation failed.\nError message:\n%s")
+                % exception, _('Error'))
+        elif exception:
+            try:
+                common.process_exception(exception)
+            except RPCException:
+                pass
+        if exception and not report:
+            self.destroy()
             return
+        report.sort()
+        count, errors, lines = 0, False, []
+        for index, first, count_, duration, error in report:
+            if error:
+                errors = True
+                lines.append(_('Batch %(batch)s from line %(line)s: '
+                        '%(error)s') % {
+                        'batch': index + 1,
+                        'line': first,
+                        'error': error,
+                        })
+            else:
+                count += count_
+                lines.append(_('Batch %(batch)s from line %(line)s: '
+                        '%(count)s records in %(duration).2fs') % {
+                        'batch': index + 1,
+                        'line': first,
+                        'count': count_,
+                        'duration': duration,
+                        })
         if count == 1:
-            common.message(_('%d record imported.') % count)
+            summary = _('%d record imported.') % count
         else:
-            common.message(_('%d records imported.') % count)
+            summary = _('%d records imported.') % count
+        if errors or self.cancelled or exception:
+            common.warning('\n'.join(lines), summary)
+        else:
+            checkpoint.clear()
+            common.message(summary + '\n\n' + '\n'.join(lines))
+        self.destroy()
+
+
+class _Checkpoint(object):
+    """Indexes of the batches of a file imported into a model
+
+    The checkpoint is valid only for the same file content, fields and
+    options."""
+
+    def __init__(self, fname, model, fields, options):
+        stat = os.stat(fname)
+        key = json.dumps([os.path.abspath(fname), stat.st_size,
+                stat.st_mtime, model, fields, options], sort_keys=True)
+        self.path = os.path.join(CHECKPOINTS_PATH,
+            hashlib.sha1(key.encode('utf-8')).hexdigest())
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as fp:
+                self.done = set(json.load(fp))
+        except (IOError, ValueError):
+            self.done = set()
+
+    def commit(self, index):
+        with self.lock:
+            self.done.add(index)
+            try:
+                os.makedirs(CHECKPOINTS_PATH, 0o700, exist_ok=True)
+                with open(self.path + '.tmp', 'w') as fp:
+                    json.dump(sorted(self.done), fp)
+                os.replace(self.path + '.tmp', self.path)
+            except OSError:
+                logger.warning(
+                    "Unable to write import checkpoint %s", self.path,
+                    exc_info=True)
+
+    def clear(self):
+        self.done = set()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -1,8 +1,9 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-import copy
+import codecs
 import xmlrpc.client
 import json
+import re
 import ssl
 import http.client
 from decimal import Decimal
@@ -13,13 +14,28 @@ import base64
 import threading
 import errno
 import logging
+import mmap
+import os
+import pickle
+import tempfile
+import time
+import zlib
 from functools import partial
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from contextlib import contextmanager
 from functools import reduce
 from urllib.parse import urljoin, quote, urlparse
 from urllib.request import getproxies
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 __all__ = ["ResponseError", "Fault", "ProtocolError", "Transport",
     "ServerProxy", "ServerPool"]
 CONNECT_TIMEOUT = 5
@@ -45,66 +61,222 @@ class ProtocolError(xmlrpc.client.ProtocolError):
     pass
 
 
+_DECODERS = {
+    'datetime': lambda dct: datetime.datetime(
+        dct['year'], dct['month'], dct['day'],
+        dct['hour'], dct['minute'], dct['second'], dct['microsecond']),
+    'date': lambda dct: datetime.date(dct['year'], dct['month'], dct['day']),
+    'time': lambda dct: datetime.time(
+        dct['hour'], dct['minute'], dct['second'], dct['microsecond']),
+    'timedelta': lambda dct: datetime.timedelta(seconds=dct['seconds']),
+    'bytes': lambda dct: base64.decodebytes(dct['base64'].encode('utf-8')),
+    'Decimal': lambda dct: Decimal(dct['decimal']),
+    }
+
+
 def object_hook(dct):
     if '__class__' in dct:
-        if dct['__class__'] == 'datetime':
-            return datetime.datetime(dct['year'], dct['month'], dct['day'],
-                dct['hour'], dct['minute'], dct['second'], dct['microsecond'])
-        elif dct['__class__'] == 'date':
-            return datetime.date(dct['year'], dct['month'], dct['day'])
-        elif dct['__class__'] == 'time':
-            return datetime.time(dct['hour'], dct['minute'], dct['second'],
-                dct['microsecond'])
-        elif dct['__class__'] == 'timedelta':
-            return datetime.timedelta(seconds=dct['seconds'])
-        elif dct['__class__'] == 'bytes':
-            return base64.decodebytes(dct['base64'].encode('utf-8'))
-        elif dct['__class__'] == 'Decimal':
-            return Decimal(dct['decimal'])
+        decoder = _DECODERS.get(dct['__class__'])
+        if decoder:
+            return decoder(dct)
     return dct
 
 
+def _encode_datetime(obj):
+    return {'__class__': 'datetime',
+        'year': obj.year,
+        'month': obj.month,
+        'day': obj.day,
+        'hour': obj.hour,
+        'minute': obj.minute,
+        'second': obj.second,
+        'microsecond': obj.microsecond,
+        }
+
+
+def _encode_date(obj):
+    return {'__class__': 'date',
+        'year': obj.year,
+        'month': obj.month,
+        'day': obj.day,
+        }
+
+
+def _encode_time(obj):
+    return {'__class__': 'time',
+        'hour': obj.hour,
+        'minute': obj.minute,
+        'second': obj.second,
+        'microsecond': obj.microsecond,
+        }
+
+
+def _encode_timedelta(obj):
+    return {'__class__': 'timedelta',
+        'seconds': obj.total_seconds(),
+        }
+
+
+def _encode_bytes(obj):
+    return {'__class__': 'bytes',
+        'base64': base64.encodebytes(obj).decode('utf-8'),
+        }
+
+
+def _encode_decimal(obj):
+    return {'__class__': 'Decimal',
+        'decimal': str(obj),
+        }
+
+
+# The order matters for the subclasses as datetime is a date
+_ENCODERS = OrderedDict([
+        (datetime.datetime, _encode_datetime),
+        (datetime.date, _encode_date),
+        (datetime.time, _encode_time),
+        (datetime.timedelta, _encode_timedelta),
+        (bytes, _encode_bytes),
+        (mmap.mmap, _encode_bytes),
+        (Decimal, _encode_decimal),
+        ])
+
+
 class JSONEncoder(json.JSONEncoder):
 
     def default(self, obj):
-        if isinstance(obj, datetime.date):
-            if isinstance(obj, datetime.datetime):
-                return {'__class__': 'datetime',
-                        'year': obj.year,
-                        'month': obj.month,
-                        'day': obj.day,
-                        'hour': obj.hour,
-                        'minute': obj.minute,
-                        'second': obj.second,
-                        'microsecond': obj.microsecond,
-                        }
-            return {'__class__': 'date',
-                    'year': obj.year,
-                    'month': obj.month,
-                    'day': obj.day,
-                    }
-        elif isinstance(obj, datetime.time):
-            return {'__class__': 'time',
-                'hour': obj.hour,
-                'minute': obj.minute,
-                'second': obj.second,
-                'microsecond': obj.microsecond,
-                }
-        elif isinstance(obj, datetime.timedelta):
-            return {'__class__': 'timedelta',
-                'seconds': obj.total_seconds(),
-                }
-        elif isinstance(obj, bytes):
-            return {'__class__': 'bytes',
-                'base64': base64.encodebytes(obj).decode('utf-8'),
-                }
-        elif isinstance(obj, Decimal):
-            return {'__class__': 'Decimal',
-                'decimal': str(obj),
-                }
+        encoder = _ENCODERS.get(obj.__class__)
+        if encoder:
+            return encoder(obj)
+        for class_, encoder in _ENCODERS.items():
+            if isinstance(obj, class_):
+                return encoder(obj)
         return super(JSONEncoder, self).default(obj)
 
 
+class _Body(object):
+    "Request body with the memory maps encoded in base64 while it is sent"
+    # base64.encodebytes makes lines of 76 characters from 57 bytes
+    chunk_size = 57 * 1024
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __len__(self):
+        size = 0
+        for part in self.parts:
+            if isinstance(part, bytes):
+                size += len(part)
+            else:
+                lines, rest = divmod(len(part), 57)
+                # The new lines are escaped in the JSON string
+                size += lines * (76 + 2)
+                if rest:
+                    size += -(-rest // 3) * 4 + 2
+        return size
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            for i in range(0, len(part), self.chunk_size):
+                yield base64.encodebytes(
+                    part[i:i + self.chunk_size]).replace(b'\n', b'\\n')
+
+
+# Placeholder of the memory maps in the encoded requests
+_BUFFER_NONCE = os.urandom(8).hex()
+_BUFFER = 'tryton-buffer-' + _BUFFER_NONCE + '-%d'
+_BUFFER_RE = re.compile(
+    ('tryton-buffer-' + _BUFFER_NONCE + '-').encode('ascii') + rb'(\d+)')
+
+
+class PythonCodec(object):
+    "Encode and decode the typed JSON with the standard library"
+    name = 'python'
+
+    def __init__(self):
+        self.encoder = JSONEncoder(separators=(',', ':'))
+        self.decoder = json.JSONDecoder(object_hook=object_hook)
+
+    def dumps(self, obj):
+        return self.encoder.encode(obj)
+
+    def dump_body(self, obj):
+        """Return the encoded obj as bytes or as a _Body when it contains
+        memory maps so they are not copied in the request"""
+        buffers = []
+
+        def default(value):
+            if isinstance(value, mmap.mmap):
+                buffers.append(value)
+                return {'__class__': 'bytes',
+                    'base64': _BUFFER % (len(buffers) - 1),
+                    }
+            return self.encoder.default(value)
+        data = json.JSONEncoder(separators=(',', ':'), default=default
+            ).encode(obj).encode('utf-8')
+        if not buffers:
+            return data
+        parts = _BUFFER_RE.split(data)
+        for i in range(1, len(parts), 2):
+            parts[i] = buffers[int(parts[i])]
+        return _Body(parts)
+
+    def loads(self, data):
+        if not isinstance(data, str):
+            data = data.decode('utf-8')
+        return self.decoder.decode(data)
+
+
+class OrjsonCodec(PythonCodec):
+    """Decode with orjson and convert the typed objects afterwards
+
+    The encoding stays the one of the standard library as orjson does not
+    produce the same output (no ASCII escaping, different float format).
+    The data that orjson refuses to decode (NaN and Infinity) is decoded by
+    PythonCodec. The integer columns fit in the 64 bits that orjson decodes
+    as integers, larger integers would be decoded as floats."""
+    name = 'orjson'
+
+    def loads(self, data):
+        try:
+            result = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return super(OrjsonCodec, self).loads(data)
+        marker = '"__class__"' if isinstance(data, str) else b'"__class__"'
+        if marker in data:
+            result = self._convert(result)
+        return result
+
+    def _convert(self, value):
+        if type(value) is dict:
+            items = value.items()
+        else:
+            items = enumerate(value)
+        for key, item in items:
+            type_ = type(item)
+            if type_ is dict:
+                # The typed objects contain only scalars
+                if '__class__' in item:
+                    value[key] = object_hook(item)
+                else:
+                    self._convert(item)
+            elif type_ is list:
+                self._convert(item)
+        return value
+
+
+CODECS = {
+    PythonCodec.name: PythonCodec,
+    }
+if orjson:
+    CODECS[OrjsonCodec.name] = OrjsonCodec
+    CODEC = OrjsonCodec()
+else:
+    CODEC = PythonCodec()
+
+
 class JSONParser(object):
 
     def __init__(self, target):
@@ -118,29 +290,194 @@ class JSONParser(object):
 
 
 class JSONUnmarshaller(object):
-    def __init__(self):
+    """Decode the response while it is received
+
+    The responses up to stream_threshold bytes are decoded at once. Above,
+    the items of a result list of objects are decoded as soon as they are
+    complete so only the text of the pending items is kept in memory."""
+    _head = re.compile(r'\s*\{\s*"id"\s*:\s*[^,]*,\s*"result"\s*:\s*\[\s*')
+    _separator = re.compile(r'[\s,]*')
+    _delimiter = re.compile(r'\s*[,\]]')
+
+    def __init__(self, stream_threshold=0):
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder(object_hook=object_hook)
         self.data = []
+        self.size = 0
+        self.stream_threshold = stream_threshold
+        # The bytes received until the response is known to be large
+        self.raw, self.raw_size = [], 0
+        self.streaming = None
+        self.head = ''
+        self.items = None
+        self.tail = ''
+        # Size of the pending data under which no decoding is tried
+        self.threshold = 0
 
     def feed(self, data):
-        self.data.append(data.decode('utf-8'))
+        if self.raw is not None:
+            self.raw.append(data)
+            self.raw_size += len(data)
+            if self.raw_size <= self.stream_threshold:
+                return
+            data, self.raw = b''.join(self.raw), None
+        self.data.append(self.decoder.decode(data))
+        if self.streaming is False or self.tail:
+            return
+        self.size += len(self.data[-1])
+        if self.streaming is None:
+            text = ''.join(self.data)
+            match = self._head.match(text)
+            if not match:
+                if len(text) > 128:
+                    self.streaming = False
+                return
+            # Only objects and lists are worth to be decoded one by one
+            first = text[match.end():match.end() + 1]
+            if first not in {'{', '['}:
+                if first:
+                    self.streaming = False
+                return
+            self.streaming = True
+            self.head = text[:match.end()]
+            self.data = [text[match.end():]]
+            self.size = len(self.data[0])
+            self.items = []
+        if self.size >= self.threshold:
+            self._decode_items()
+
+    def _decode_items(self):
+        text = ''.join(self.data)
+        pos = 0
+        while True:
+            pos = self._separator.match(text, pos).end()
+            if pos >= len(text):
+                break
+            if text[pos] == ']':
+                self.tail = text[pos:]
+                text, pos = '', 0
+                break
+            try:
+                item, end = self.json_decoder.raw_decode(text, pos)
+            except ValueError:
+                break
+            # A complete item is always followed by a delimiter
+            if not self._delimiter.match(text, end):
+                break
+            self.items.append(item)
+            pos = end
+        text = text[pos:]
+        self.data = [text]
+        self.size = len(text)
+        # Double the threshold to keep linear the decoding of large items
+        self.threshold = 2 * len(text)
+
+    def close(self):
+        if self.raw is not None:
+            return CODEC.loads(b''.join(self.raw))
+        self.data.append(self.decoder.decode(b'', final=True))
+        if not self.streaming:
+            return CODEC.loads(''.join(self.data))
+        if not self.tail:
+            self._decode_items()
+        response = json.loads(self.head + self.tail + ''.join(self.data),
+            object_hook=object_hook)
+        response['result'] = self.items
+        return response
+
+
+class _DecompressedResponse(object):
+    "Decompress the response while it is read"
+
+    def __init__(self, response, encoding):
+        self.response = response
+        self.encoding = encoding
+        if encoding == 'zstd':
+            self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.eof = False
+        self.size = 0
+        self.decompressed_size = 0
+        self.duration = 0
+
+    def read(self, size):
+        while not self.eof:
+            data = self.response.read(size)
+            start = time.perf_counter()
+            if data:
+                self.size += len(data)
+                data = self.decompressor.decompress(data)
+            else:
+                self.eof = True
+                data = self.decompressor.flush()
+            self.duration += time.perf_counter() - start
+            if data:
+                self.decompressed_size += len(data)
+                return data
+        return b''
 
     def close(self):
-        return json.loads(''.join(self.data), object_hook=object_hook)
+        logger.debug('%s response: %s bytes decompressed to %s in %.3fs',
+            self.encoding, self.size, self.decompressed_size, self.duration)
+
+
+class _TLSSessions(object):
+    "Share the SSL context and sessions to resume the TLS handshakes"
+
+    def __init__(self, ca_certs=None):
+        self.context = ssl.create_default_context(cafile=ca_certs)
+        self.sessions = {}
+        self.handshakes = 0
+        self.resumed = 0
+        self._lock = threading.Lock()
+
+    def wrap_socket(self, sock, server_hostname):
+        session = self.sessions.get(server_hostname)
+        sock = self.context.wrap_socket(
+            sock, server_hostname=server_hostname, session=session)
+        with self._lock:
+            if sock.session_reused:
+                self.resumed += 1
+            else:
+                self.handshakes += 1
+        self.store(sock, server_hostname)
+        return sock
+
+    def store(self, sock, server_hostname):
+        # With TLS 1.3 the session ticket is received after the handshake
+        if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+            self.sessions[server_hostname] = sock.session
 
 
 class Transport(xmlrpc.client.SafeTransport):
 
     accept_gzip_encoding = True
     encode_threshold = 1400  # common MTU
+    read_size = 64 * 1024
+    compress_level = 9
+    stream_threshold = 1024 * 1024
 
     def __init__(
-            self, fingerprints=None, ca_certs=None, session=None):
+            self, fingerprints=None, ca_certs=None, session=None, tls=None):
         xmlrpc.client.Transport.__init__(self)
         self._connection = (None, None)
         self.__fingerprints = fingerprints
         self.__ca_certs = ca_certs
+        self.__tls = tls or _TLSSessions(ca_certs)
         self.session = session
         self.set_proxies()
+        from tryton.config import CONFIG
+        self.encode_threshold = CONFIG['compression.threshold']
+        self.accept_encodings = ['gzip']
+        if zstandard:
+            self.accept_encodings.insert(0, 'zstd')
+
+    def close(self):
+        connection = self._connection[1]
+        if connection and connection.sock:
+            self.__tls.store(connection.sock, connection.host)
+        super().close()
 
     def set_proxies(self):
         self.http_proxy = None
@@ -182,17 +519,33 @@ class Transport(xmlrpc.client.SafeTransport):
             }
         return headers
 
-    def getparser(self):
-        target = JSONUnmarshaller()
+    def getparser(self, stream_threshold=0):
+        target = JSONUnmarshaller(stream_threshold)
         parser = JSONParser(target)
         return parser, target
 
     def parse_response(self, response):
         cache = None
+        stream = response
         if hasattr(response, 'getheader'):
             cache = int(response.getheader('X-Tryton-Cache', 0))
-        response = super().parse_response(response)
-        if cache:
+            encoding = response.getheader('Content-Encoding', '')
+            if encoding in self.accept_encodings:
+                stream = _DecompressedResponse(response, encoding)
+
+        # Small responses are faster to decode at once, the size is the
+        # decompressed one which is known only once received
+        parser, unmarshaller = self.getparser(self.stream_threshold)
+        while True:
+            data = stream.read(self.read_size)
+            if not data:
+                break
+            parser.feed(data)
+        if stream is not response:
+            stream.close()
+        parser.close()
+        response = unmarshaller.close()
+        if cache and isinstance(response, dict):
             try:
                 response['cache'] = int(cache)
             except ValueError:
@@ -221,14 +574,46 @@ class Transport(xmlrpc.client.SafeTransport):
         for key, val in headers:
             if key == 'Content-Type':
                 val = 'application/json'
+            elif key == 'Accept-Encoding':
+                val = ', '.join(self.accept_encodings)
             connection.putheader(key, val)
 
+    def send_content(self, connection, request_body):
+        if isinstance(request_body, _Body):
+            connection.putheader('Content-Length', str(len(request_body)))
+            connection.endheaders()
+            for chunk in request_body:
+                connection.send(chunk)
+            return
+        if (self.encode_threshold is None
+                or self.encode_threshold >= len(request_body)):
+            connection.putheader('Content-Length', str(len(request_body)))
+            connection.endheaders(request_body)
+            return
+        # Compress by pieces to not build an other copy of the whole body
+        start = time.perf_counter()
+        compressor = zlib.compressobj(
+            self.compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = memoryview(request_body)
+        chunks = [compressor.compress(body[i:i + self.read_size])
+            for i in range(0, len(body), self.read_size)]
+        chunks.append(compressor.flush())
+        size = sum(len(c) for c in chunks)
+        logger.debug('gzip request: %s bytes compressed to %s in %.3fs',
+            len(request_body), size, time.perf_counter() - start)
+        connection.putheader('Content-Encoding', 'gzip')
+        connection.putheader('Content-Length', str(size))
+        connection.endheaders()
+        for chunk in chunks:
+            if chunk:
+                connection.send(chunk)
+
     def make_connection(self, host):
         if self._connection and host == self._connection[0]:
             return self._connection[1]
         host, self._extra_headers, x509 = self.get_host_info(host)
 
-        ssl_ctx = ssl.create_default_context(cafile=self.__ca_certs)
+        tls = self.__tls
 
         class HTTPSConnection(http.client.HTTPSConnection):
 
@@ -238,8 +623,7 @@ class Transport(xmlrpc.client.SafeTransport):
                 if self._tunnel_host:
                     self.sock = sock
                     self._tunnel()
-                self.sock = ssl_ctx.wrap_socket(
-                    sock, server_hostname=self.host)
+                self.sock = tls.wrap_socket(sock, server_hostname=self.host)
 
         def set_connection(ConnectionClass):
             if self.http_proxy:
@@ -305,34 +689,24 @@ class Transport(xmlrpc.client.SafeTransport):
 
 class ServerProxy(xmlrpc.client.ServerProxy):
     __id = 0
+    _batch_unsupported = set()
+    # Errors of the servers which do not know batch requests
+    _batch_errors = {'400', '404', '405', '501', '-32600', '-32601'}
 
     def __init__(self, host, port, database='', verbose=0,
-            fingerprints=None, ca_certs=None, session=None, cache=None):
+            fingerprints=None, ca_certs=None, session=None, cache=None,
+            tls=None):
         self.__host = '%s:%s' % (host, port)
         if database:
             database = quote(database)
             self.__handler = '/%s/' % database
         else:
             self.__handler = '/'
-        self.__transport = Transport(fingerprints, ca_certs, session)
+        self.__transport = Transport(fingerprints, ca_certs, session, tls)
         self.__verbose = verbose
         self.__cache = cache
 
-    def __request(self, methodname, params):
-        dumper = partial(json.dumps, cls=JSONEncoder, separators=(',', ':'))
-        self.__id += 1
-        id_ = self.__id
-        if self.__cache and self.__cache.cached(methodname):
-            try:
-                return self.__cache.get(methodname, dumper(params))
-            except KeyError:
-                pass
-        request = dumper({
-                'id': id_,
-                'method': methodname,
-                'params': params,
-                }).encode('utf-8')
-
+    def __send(self, request):
         try:
             try:
                 response = self.__transport.request(
@@ -358,6 +732,24 @@ class ServerProxy(xmlrpc.client.ServerProxy):
         except Exception:
             self.__transport.close()
             raise
+        return response
+
+    def __request(self, methodname, params):
+        self.__id += 1
+        id_ = self.__id
+        if self.__cache and self.__cache.cached(methodname):
+            try:
+                return self.__cache.get(
+                    methodname, self.__cache.key(params))
+            except KeyError:
+                pass
+        request = CODEC.dump_body({
+                'id': id_,
+                'method': methodname,
+                'params': params,
+                })
+
+        response = self.__send(request)
         if response['id'] != id_:
             raise ResponseError('Invalid response id (%s) excpected %s' %
                 (response['id'], id_))
@@ -365,10 +757,87 @@ class ServerProxy(xmlrpc.client.ServerProxy):
             raise Fault(*response['error'])
         if self.__cache and response.get('cache'):
             self.__cache.set(
-                methodname, dumper(params), response['cache'],
+                methodname, self.__cache.key(params), response['cache'],
                 response['result'])
         return response['result']
 
+    def batch(self, calls):
+        """Send the (methodname, params) calls in a single batch request
+
+        The result of each call is returned in the same order as calls. A
+        failing call gets its Fault instead of a result. If the server does
+        not accept batch requests, the calls are sent one by one."""
+        dumper = CODEC.dumps
+        results = [None] * len(calls)
+        requests = {}
+        for i, (methodname, params) in enumerate(calls):
+            if self.__cache and self.__cache.cached(methodname):
+                try:
+                    results[i] = self.__cache.get(
+                        methodname, self.__cache.key(params))
+                    continue
+                except KeyError:
+                    pass
+            self.__id += 1
+            requests[self.__id] = i
+        if not requests:
+            return results
+
+        if len(requests) == 1 or self.__host in self._batch_unsupported:
+            responses = None
+        else:
+            request = dumper([{
+                        'id': id_,
+                        'method': calls[i][0],
+                        'params': calls[i][1],
+                        } for id_, i in requests.items()]).encode('utf-8')
+            try:
+                responses = self.__send(request)
+            except Fault as fault:
+                if str(fault.faultCode) not in self._batch_errors:
+                    raise
+                unsupported = True
+            else:
+                error = (isinstance(responses, dict)
+                    and responses.get('error'))
+                if isinstance(error, dict):
+                    error = [error.get('code')]
+                unsupported = bool(error) and (
+                    str(error[0]) in self._batch_errors)
+            if unsupported:
+                logger.info('batch request not supported by %s', self.__host)
+                self._batch_unsupported.add(self.__host)
+                self.__transport.close()
+                responses = None
+            elif (not isinstance(responses, list)
+                    or {r.get('id') for r in responses} != set(requests)):
+                # Send the calls one by one without excluding the server
+                logger.warning('invalid batch response from %s', self.__host)
+                self.__transport.close()
+                responses = None
+
+        if responses is None:
+            for i in requests.values():
+                methodname, params = calls[i]
+                try:
+                    results[i] = self.__request(methodname, params)
+                except Fault as fault:
+                    results[i] = fault
+            return results
+
+        for response in responses:
+            i = requests[response['id']]
+            if response.get('error'):
+                results[i] = Fault(*response['error'])
+            else:
+                results[i] = response['result']
+                if self.__cache and response.get('cache'):
+                    methodname, params = calls[i]
+                    self.__cache.set(
+                        methodname, self.__cache.key(params),
+                        response['cache'], response['result'])
+        return results
+
     def close(self):
         self.__transport.close()
 
@@ -380,52 +849,114 @@ class ServerProxy(xmlrpc.client.ServerProxy):
 
 class ServerPool(object):
     keep_max = 4
+    max_connections = 8
+    idle_timeout = 60
+    wait_timeout = 5 * 60
     _cache = None
 
     def __init__(self, host, port, database, *args, **kwargs):
+        from tryton.config import CONFIG
         if kwargs.get('cache'):
-            self._cache = kwargs['cache'] = _Cache()
+            self._cache = kwargs['cache'] = _Cache(
+                max_size=CONFIG['cache.max_size'],
+                max_entries=CONFIG['cache.max_entries'],
+                path=kwargs.pop('cache_path', None))
+        kwargs.pop('cache_path', None)
+        self._tls = kwargs['tls'] = _TLSSessions(kwargs.get('ca_certs'))
         self.ServerProxy = partial(
             ServerProxy, host, port, database, *args, **kwargs)
 
         self._host = host
         self._port = port
         self._database = database
+        self.max_connections = CONFIG['connection.max']
+        self.idle_timeout = CONFIG['connection.idle_timeout']
+        self.wait_timeout = CONFIG['connection.wait_timeout']
 
-        self._lock = threading.Lock()
+        self._lock = threading.Condition()
+        # Idle connections with the time they were released
         self._pool = []
         self._used = {}
+        self._waiting = 0
+        self._wait_time = 0
+        self._max_wait_time = 0
+        self._created = 0
         self.session = kwargs.get('session')
 
     def getconn(self):
+        from tryton.exceptions import TrytonServerUnavailable
         with self._lock:
+            self._reap()
+            if len(self._used) >= self.max_connections:
+                start = time.monotonic()
+                self._waiting += 1
+                try:
+                    available = self._lock.wait_for(
+                        lambda: len(self._used) < self.max_connections,
+                        self.wait_timeout)
+                finally:
+                    self._waiting -= 1
+                wait_time = time.monotonic() - start
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+                if not available:
+                    raise TrytonServerUnavailable(
+                        'No connection released after %ss' % self.wait_timeout)
             if self._pool:
-                conn = self._pool.pop()
+                conn, _ = self._pool.pop()
             else:
                 conn = self.ServerProxy()
+                self._created += 1
             self._used[id(conn)] = conn
             return conn
 
     def putconn(self, conn):
         with self._lock:
-            self._pool.append(conn)
+            self._pool.append((conn, time.monotonic()))
             del self._used[id(conn)]
 
             # Remove oldest connections
             while len(self._pool) > self.keep_max:
-                conn = self._pool.pop()
+                conn, _ = self._pool.pop(0)
                 conn.close()
+            self._lock.notify()
+
+    def _reap(self):
+        "Close the connections idle for more than idle_timeout"
+        limit = time.monotonic() - self.idle_timeout
+        while self._pool and self._pool[0][1] < limit:
+            conn, _ = self._pool.pop(0)
+            conn.close()
 
     def close(self):
         with self._lock:
-            for conn in self._pool + list(self._used.values()):
+            for conn, _ in self._pool:
+                conn.close()
+            for conn in self._used.values():
                 conn.close()
             self._pool = []
             self._used.clear()
+            self._lock.notify_all()
+        if self._cache:
+            self._cache.save()
+
+    @property
+    def metrics(self):
+        with self._lock:
+            return {
+                'in_use': len(self._used),
+                'idle': len(self._pool),
+                'waiting': self._waiting,
+                'wait_time': self._wait_time,
+                'max_wait_time': self._max_wait_time,
+                'connections': self._created,
+                'handshakes': self._tls.handshakes,
+                'resumed_handshakes': self._tls.resumed,
+                }
 
     @property
     def ssl(self):
-        for conn in self._pool + list(self._used.values()):
+        for conn in [c for c, _ in self._pool] + list(self._used.values()):
             return conn.ssl
         return None
 
@@ -441,43 +972,257 @@ class ServerPool(object):
     @contextmanager
     def __call__(self):
         conn = self.getconn()
-        yield conn
-        self.putconn(conn)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def batch(self, calls):
+        with self() as conn:
+            return conn.batch(calls)
 
     def clear_cache(self, prefix=None):
         if self._cache:
             self._cache.clear(prefix)
 
+    def validate_cache(self, fingerprint):
+        if self._cache:
+            self._cache.validate(fingerprint)
+
+    def load_value(self, name):
+        if self._cache:
+            return self._cache.load_value(name)
+
+    def save_value(self, name, value):
+        if self._cache:
+            self._cache.save_value(name, value)
+
 
 class _Cache:
+    "LRU cache of the results bounded in number of entries and in bytes"
+    # Methods for which the entries are kept on disk between sessions
+    persistent = {'fields_view_get', 'view_toolbar_get'}
+
+    def __init__(self, max_size=50 * 1024 * 1024, max_entries=10000,
+            sweep_interval=60, save_interval=5 * 60, path=None):
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.save_interval = save_interval
+        self.path = path
+        # The values are stored pickled so they can not be modified by the
+        # callers and their size is known
+        self.store = OrderedDict()
+        self.prefixes = defaultdict(set)
+        self.stats = defaultdict(partial(dict.fromkeys,
+                ['hits', 'misses', 'evictions', 'size'], 0))
+        self.size = 0
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._next_save = time.monotonic() + save_interval
+        # The persistent entries or the values changed since the last save
+        self._dirty = False
+        self._loaded = path is None
+        # Identify the server definitions for which the persistent entries
+        # were stored
+        self.fingerprint = None
+        # Values stored by the client under a name, pickled
+        self.values = {}
+        self._lock = threading.Lock()
 
-    def __init__(self):
-        self.store = defaultdict(dict)
+    @staticmethod
+    def key(params):
+        # The client identifier changes at each start but does not change the
+        # result
+        if params and isinstance(params[-1], dict) and 'client' in params[-1]:
+            context = params[-1].copy()
+            del context['client']
+            params = list(params[:-1]) + [context]
+        return CODEC.dumps(params)
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, 'rb') as fp:
+                fingerprint, entries, values = pickle.loads(fp.read())
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.warning('Unable to load cache file %s', self.path,
+                exc_info=True)
+            return
+        self.fingerprint = fingerprint
+        self.values.update(values)
+        now = time.monotonic()
+        shift = now - time.time()
+        # The entries are saved from the least recently used, the most
+        # recently used which fit are kept
+        for prefix, key, expire, data in reversed(entries):
+            expire += shift
+            if expire < now or (prefix, key) in self.store:
+                continue
+            if len(self.store) >= self.max_entries:
+                break
+            if self.size + len(data) > self.max_size:
+                continue
+            self.store[prefix, key] = (expire, data)
+            self.store.move_to_end((prefix, key), last=False)
+            self.prefixes[prefix].add(key)
+            self.stats[prefix]['size'] += len(data)
+            self.size += len(data)
+
+    def save(self):
+        "Write the persistent entries and the values to the cache file"
+        if not self.path:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            self._dirty = False
+            shift = time.time() - time.monotonic()
+            entries = [(prefix, key, expire + shift, data)
+                for (prefix, key), (expire, data) in self.store.items()
+                if self._persistent(prefix)]
+            values = self.values.copy()
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory, 0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump((self.fingerprint, entries, values), fp,
+                    pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.warning('Unable to write cache file %s', self.path,
+                exc_info=True)
+
+    def _save_later(self):
+        "Save in the background the changes since the last save when due"
+        now = time.monotonic()
+        if not self._dirty or not self.path or self._next_save > now:
+            return
+        self._next_save = now + self.save_interval
+        thread = threading.Thread(target=self.save)
+        thread.daemon = True
+        thread.start()
+
+    def _persistent(self, prefix):
+        return prefix.rsplit('.', 1)[-1] in self.persistent
+
+    def validate(self, fingerprint):
+        """Remove the persistent entries stored for other server definitions
+
+        A fingerprint of None is never valid."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if fingerprint is None or fingerprint != self.fingerprint:
+                for prefix, key in list(self.store):
+                    if self._persistent(prefix):
+                        self._remove(prefix, key)
+                self._dirty = True
+            self.fingerprint = fingerprint
+
+    def load_value(self, name):
+        "Return the value stored under name or None"
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            data = self.values.get(name)
+        if data is not None:
+            return pickle.loads(data)
+
+    def save_value(self, name, value):
+        "Store the value under name with the persistent entries"
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self.values[name] = data
+            self._dirty = True
 
     def cached(self, prefix):
-        return prefix in self.store
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+        return prefix in self.prefixes
 
     def set(self, prefix, key, expire, value):
-        if isinstance(expire, (int, float)):
-            expire = datetime.timedelta(seconds=expire)
         if isinstance(expire, datetime.timedelta):
-            expire = datetime.datetime.now() + expire
-        self.store[prefix][key] = (expire, copy.deepcopy(value))
+            expire = expire.total_seconds()
+        expire = time.monotonic() + expire
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._remove(prefix, key)
+            if len(data) > self.max_size:
+                return
+            self.store[prefix, key] = (expire, data)
+            self.prefixes[prefix].add(key)
+            self.stats[prefix]['size'] += len(data)
+            self.size += len(data)
+            if self._persistent(prefix):
+                self._dirty = True
+            while (self.size > self.max_size
+                    or len(self.store) > self.max_entries):
+                (old_prefix, old_key), _ = next(iter(self.store.items()))
+                self._remove(old_prefix, old_key)
+                self.stats[old_prefix]['evictions'] += 1
+            if self._next_sweep < time.monotonic():
+                self._sweep()
+            self._save_later()
 
     def get(self, prefix, key):
-        now = datetime.datetime.now()
-        try:
-            expire, value = self.store[prefix][key]
-        except ValueError:
-            raise KeyError
-        if expire < now:
-            self.store.pop(key)
-            raise KeyError
+        now = time.monotonic()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            try:
+                expire, data = self.store[prefix, key]
+            except KeyError:
+                self.stats[prefix]['misses'] += 1
+                raise
+            if expire < now:
+                self._remove(prefix, key)
+                self.stats[prefix]['misses'] += 1
+                raise KeyError
+            self.store.move_to_end((prefix, key))
+            self.stats[prefix]['hits'] += 1
+            if self._next_sweep < now:
+                self._sweep()
         logger.info('(cached) %s %s', prefix, key)
-        return copy.deepcopy(value)
+        return pickle.loads(data)
+
+    def _remove(self, prefix, key):
+        try:
+            _, data = self.store.pop((prefix, key))
+        except KeyError:
+            return
+        self.prefixes[prefix].discard(key)
+        self.stats[prefix]['size'] -= len(data)
+        self.size -= len(data)
+
+    def _sweep(self):
+        now = time.monotonic()
+        for (prefix, key), (expire, _) in list(self.store.items()):
+            if expire < now:
+                self._remove(prefix, key)
+        self._next_sweep = now + self.sweep_interval
+
+    def statistics(self):
+        with self._lock:
+            return {p: s.copy() for p, s in self.stats.items()}
 
     def clear(self, prefix=None):
-        if prefix:
-            self.store[prefix].clear()
-        else:
-            self.store.clear()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if prefix:
+                for key in list(self.prefixes.get(prefix, [])):
+                    self._remove(prefix, key)
+            else:
+                self.store.clear()
+                self.prefixes.clear()
+                self.stats.clear()
+                self.size = 0
@@ -4,7 +4,7 @@ import json
 import datetime
 from decimal import Decimal
 from dateutil.relativedelta import relativedelta
-from functools import reduce
+from functools import reduce, lru_cache, partial
 
 
 class PYSON(object):
@@ -114,6 +114,11 @@ class PYSONDecoder(json.JSONDecoder):
         self.noeval = noeval
         super(PYSONDecoder, self).__init__(object_hook=self._object_hook)
 
+    def decode(self, s, *args, **kwargs):
+        if self.noeval:
+            return super(PYSONDecoder, self).decode(s, *args, **kwargs)
+        return compile_pyson(s)(self.__context)
+
     def _object_hook(self, dct):
         if '__class__' in dct:
             klass = CONTEXT.get(dct['__class__'])
@@ -728,3 +733,66 @@ CONTEXT = {
     'TimeDelta': TimeDelta,
     'Len': Len,
 }
+
+
+class CompiledPYSON(object):
+    """PYSON expression parsed once into a Python function evaluated against
+    any context
+
+    keys is the set of the context keys read by the expression or None if
+    they can not be known."""
+
+    def __init__(self, expression):
+        self.keys = set()
+        self._namespace = {}
+        try:
+            code = self._compile(json.loads(expression))
+            self._evaluate = eval('lambda context: ' + code, self._namespace)
+        except (SyntaxError, RecursionError, MemoryError):
+            # The expression is nested too deeply for the Python parser
+            self.keys = None
+            self._namespace = None
+            self._evaluate = partial(self._decode, expression)
+        if self.keys is not None:
+            self.keys = frozenset(self.keys)
+
+    def __call__(self, context):
+        return self._evaluate(context)
+
+    @staticmethod
+    def _decode(expression, context):
+        decoder = PYSONDecoder(context)
+        return json.JSONDecoder.decode(decoder, expression)
+
+    def _constant(self, value):
+        name = '_c%s' % len(self._namespace)
+        self._namespace[name] = value
+        return name
+
+    def _compile(self, value):
+        if isinstance(value, dict):
+            klass = CONTEXT.get(value.get('__class__'))
+            if klass is Eval and self.keys is not None:
+                if isinstance(value.get('v'), str):
+                    self.keys.add(value['v'])
+                else:
+                    self.keys = None
+            code = '{%s}' % ', '.join('%s: %s' % (
+                    self._constant(k), self._compile(v))
+                for k, v in value.items())
+            if klass:
+                code = '%s(%s, context)' % (self._constant(klass.eval), code)
+            return code
+        elif isinstance(value, list):
+            return '[%s]' % ''.join(
+                '%s, ' % self._compile(v) for v in value)
+        elif value is None or isinstance(value, (bool, int)):
+            return repr(value)
+        else:
+            return self._constant(value)
+
+
+@lru_cache(maxsize=4096)
+def compile_pyson(expression):
+    "Return the CompiledPYSON of the expression string"
+    return CompiledPYSON(expression)
@@ -1,5 +1,6 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import hashlib
 import http.client
 import logging
 import socket
@@ -99,11 +100,64 @@ def login(parameters):
     if CONNECTION is not None:
         CONNECTION.close()
     CONNECTION = ServerPool(
-        hostname, port, database, session=session, cache=not CONFIG['dev'])
+        hostname, port, database, session=session, cache=not CONFIG['dev'],
+        cache_path=_cache_path(hostname, port, database, username, language))
     _CLIENT_DATE = date
     bus.listen(CONNECTION)
 
 
+def _cache_path(hostname, port, database, username, language):
+    version = server_version(hostname, port)
+    key = '\0'.join(map(str,
+            [hostname, port, database, version, username, language]))
+    return os.path.join(get_config_dir(), 'cache',
+        hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+# Models of the definitions cached with the views
+_CACHE_MODELS = ['ir.ui.view', 'ir.model.field', 'ir.action.keyword']
+
+
+def validate_cache():
+    "Remove the stored views if their definitions changed on the server"
+    if CONNECTION is None:
+        return
+    # The number of records and their last creation and modification
+    # change with the activation, the update or the customisation
+    calls = []
+    for model in _CACHE_MODELS:
+        calls.append(('model', model, 'search_count', [], CONTEXT))
+        for field in ['create_date', 'write_date']:
+            calls.append(('model', model, 'search_read',
+                    [(field, '!=', None)], 0, 1, [(field, 'DESC')],
+                    [field], CONTEXT))
+    try:
+        results = execute_batch(*calls)
+    except (TrytonServerError, TrytonServerUnavailable):
+        results = None
+    if results is None or any(isinstance(r, Fault) for r in results):
+        logging.getLogger(__name__).info(
+            'Unable to read the definitions of the views')
+        fingerprint = None
+    else:
+        fingerprint = hashlib.sha1(
+            repr(results).encode('utf-8')).hexdigest()
+    CONNECTION.validate_cache(fingerprint)
+
+
+def load_cache(name):
+    "Return the value stored under name for the session or None"
+    if CONNECTION is None:
+        return None
+    return CONNECTION.load_value(name)
+
+
+def save_cache(name, value):
+    "Store value under name for the next sessions of the user"
+    if CONNECTION is not None:
+        CONNECTION.save_value(name, value)
+
+
 def logout():
     global CONNECTION, _USER
     global _CLIENT_DATE
@@ -144,6 +198,25 @@ def execute_nonblocking(*args):
     return _execute(False, *args)
 
 
+def execute_batch(*calls):
+    "Execute the calls in one round trip and return the results or faults"
+    global CONNECTION
+    if CONNECTION is None:
+        raise TrytonServerError('403')
+    batch = []
+    for args in calls:
+        name = '.'.join(args[:3])
+        args = args[3:]
+        logging.getLogger(__name__).info('%s%s' % (name, args))
+        batch.append((name, list(args)))
+    try:
+        result = CONNECTION.batch(batch)
+    except (http.client.CannotSendRequest, socket.error) as exception:
+        raise TrytonServerUnavailable(*exception.args)
+    logging.getLogger(__name__).debug(repr(result))
+    return result
+
+
 def clear_cache(prefix=None):
     if CONNECTION:
         CONNECTION.clear_cache(prefix)